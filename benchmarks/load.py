@@ -0,0 +1,111 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from config.config import db_name, peer_stale_after
+from db.database import DataBase
+from peers.protocol import FramedClient
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_SCRIPT = "import sys; from peers.peer import start_server_peer; start_server_peer(sys.argv[1])"
+
+
+class BenchmarkServer:
+    def __init__(self, workdir, mode, start_timeout=30):
+        self.workdir = workdir
+        self.mode = mode
+        self.start_timeout = start_timeout
+        self.process = None
+        self.port = None
+
+    def start(self):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [PACKAGE_ROOT, os.environ.get('PYTHONPATH')])))
+        self.process = subprocess.Popen([sys.executable, '-c', SERVER_SCRIPT, self.mode], cwd=self.workdir, env=env)
+        database = DataBase(os.path.join(self.workdir, db_name))
+        database.create_tables()
+        deadline = time.monotonic() + self.start_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Benchmark server exited with code {self.process.returncode}")
+            peer = database.find_peer(self.process.pid, time.time() - peer_stale_after)
+            if peer is not None:
+                self.port, _, self.host = peer[:3]
+                return self
+            time.sleep(0.1)
+        self.stop()
+        raise RuntimeError(f"Benchmark server did not register within {self.start_timeout}s")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+
+class ScriptedClient:
+    def __init__(self, host, port, vcs_type, repo_path, script, iterations):
+        self.host = host
+        self.port = port
+        self.vcs_type = vcs_type
+        self.repo_path = repo_path
+        self.script = script
+        self.iterations = iterations
+        self.samples = []
+        self.errors = []
+
+    def run(self, barrier):
+        sock = socket.create_connection((self.host, self.port))
+        try:
+            client = FramedClient(sock)
+            client.hello()
+            client.read_response()
+            client.read_response(client.send_command(self.vcs_type))
+            client.read_response(client.send_command(self.repo_path))
+            barrier.wait()
+            for _ in range(self.iterations):
+                for command in self.script:
+                    started = time.perf_counter()
+                    response = client.read_response(client.send_command(command))
+                    elapsed = time.perf_counter() - started
+                    self.samples.append((command, elapsed, len(response.encode('utf-8'))))
+                    if response.lstrip().startswith(('Error', 'Invalid')):
+                        self.errors.append((command, response.strip().splitlines()[0]))
+            client.read_response(client.send_command('back'))
+            client.read_response(client.send_command('exit'))
+        finally:
+            sock.close()
+
+
+def drive(host, port, vcs_type, repo_path, script, clients, iterations):
+    barrier = threading.Barrier(clients + 1)
+    workers = [ScriptedClient(host, port, vcs_type, repo_path, script, iterations) for _ in range(clients)]
+    failures = []
+
+    def run(worker):
+        try:
+            worker.run(barrier)
+        except Exception as e:
+            failures.append(e)
+            barrier.abort()
+
+    threads = [threading.Thread(target=run, args=(worker,), daemon=True) for worker in workers]
+    for thread in threads:
+        thread.start()
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        pass
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if failures:
+        raise RuntimeError(f"{len(failures)} client(s) failed: {failures[0]}")
+    samples = [sample for worker in workers for sample in worker.samples]
+    errors = [error for worker in workers for error in worker.errors]
+    return samples, errors, elapsed
@@ -0,0 +1,106 @@
+import json
+import math
+import platform
+import subprocess
+import time
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(math.ceil(q / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+def summarize(samples, errors, elapsed):
+    commands = {}
+    for command, latency, size in samples:
+        commands.setdefault(command, []).append((latency, size))
+    summary = {}
+    for command, measurements in commands.items():
+        latencies = [latency for latency, _ in measurements]
+        summary[command] = dict({
+            'count': len(latencies),
+            'throughput': len(latencies) / elapsed if elapsed else 0.0,
+            'mean': sum(latencies) / len(latencies),
+            'max': max(latencies),
+            'bytes': sum(size for _, size in measurements) // len(measurements),
+            'errors': sum(1 for error_command, _ in errors if error_command == command),
+        }, **{f"p{q}": percentile(latencies, q) for q in PERCENTILES})
+    return {
+        'elapsed': elapsed,
+        'requests': len(samples),
+        'throughput': len(samples) / elapsed if elapsed else 0.0,
+        'errors': len(errors),
+        'first_errors': [f"{command}: {message}" for command, message in errors[:5]],
+        'commands': summary,
+    }
+
+
+def revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment(parameters):
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'revision': revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': parameters,
+    }
+
+
+def save(results, path):
+    with open(path, 'w') as output:
+        json.dump(results, output, indent=2, sort_keys=True)
+
+
+def load(path):
+    with open(path) as source:
+        return json.load(source)
+
+
+def format_results(results):
+    lines = []
+    for vcs_type, result in sorted(results['backends'].items()):
+        if 'skipped' in result:
+            lines.append(f"{vcs_type}: skipped ({result['skipped']})")
+            continue
+        lines.append(f"{vcs_type}: {result['requests']} requests in {result['elapsed']:.2f}s, "
+                     f"{result['throughput']:.1f} req/s, {result['errors']} errors")
+        lines.append(f"  {'command':<28} {'count':>6} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9}")
+        for command, stats in sorted(result['commands'].items()):
+            lines.append(f"  {command:<28} {stats['count']:>6} {stats['throughput']:>8.1f} "
+                         f"{stats['p50'] * 1000:>7.1f}ms {stats['p95'] * 1000:>7.1f}ms {stats['p99'] * 1000:>7.1f}ms")
+        for error in result['first_errors']:
+            lines.append(f"  error: {error}")
+    return '\n'.join(lines)
+
+
+def compare(baseline, current, tolerance):
+    lines = []
+    regressions = 0
+    for vcs_type, result in sorted(current['backends'].items()):
+        previous = baseline['backends'].get(vcs_type)
+        if 'commands' not in result or previous is None or 'commands' not in previous:
+            continue
+        for command, stats in sorted(result['commands'].items()):
+            before = previous['commands'].get(command)
+            if before is None:
+                continue
+            for metric in [f"p{q}" for q in PERCENTILES]:
+                change = (stats[metric] - before[metric]) / before[metric] if before[metric] else 0.0
+                marker = ''
+                if change > tolerance:
+                    marker = '  REGRESSION'
+                    regressions += 1
+                lines.append(f"{vcs_type:<10} {command:<28} {metric:<4} {before[metric] * 1000:>8.1f}ms -> "
+                             f"{stats[metric] * 1000:>8.1f}ms {change:>+7.1%}{marker}")
+    return '\n'.join(lines), regressions
@@ -0,0 +1,99 @@
+import os
+import random
+import shutil
+import subprocess
+
+VCS_TOOLS = {'git': 'git', 'mercurial': 'hg', 'svn': 'svnadmin'}
+WORDS = ['alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'eta', 'theta', 'iota', 'kappa']
+COMMIT_ENV = {'GIT_AUTHOR_NAME': 'bench', 'GIT_AUTHOR_EMAIL': 'bench@localhost',
+              'GIT_COMMITTER_NAME': 'bench', 'GIT_COMMITTER_EMAIL': 'bench@localhost',
+              'HGUSER': 'bench <bench@localhost>'}
+
+
+def available(vcs_type):
+    return shutil.which(VCS_TOOLS[vcs_type]) is not None
+
+
+def run(command, cwd=None):
+    subprocess.run(command, cwd=cwd, check=True, capture_output=True, env=dict(os.environ, **COMMIT_ENV))
+
+
+def file_url(path):
+    return 'file://' + os.path.abspath(path).replace(os.sep, '/')
+
+
+def write_files(work_tree, files, file_size, generator, revision):
+    for number in range(files):
+        directory = os.path.join(work_tree, f"dir{number % 10}")
+        os.makedirs(directory, exist_ok=True)
+        words = [generator.choice(WORDS) for _ in range(max(file_size // 6, 1))]
+        with open(os.path.join(directory, f"file{number}.txt"), 'w') as output:
+            output.write(f"revision {revision}\n" + ' '.join(words) + '\n')
+
+
+def changed_files(files, generator):
+    return generator.sample(range(files), max(files // 20, 1))
+
+
+def populate(work_tree, commits, files, file_size, seed, commit):
+    generator = random.Random(seed)
+    write_files(work_tree, files, file_size, generator, 0)
+    commit(f"initial {files} files")
+    for revision in range(1, commits):
+        for number in changed_files(files, generator):
+            with open(os.path.join(work_tree, f"dir{number % 10}", f"file{number}.txt"), 'a') as output:
+                output.write(f"revision {revision} {generator.choice(WORDS)}\n")
+        commit(f"change {revision} {generator.choice(WORDS)}")
+
+
+def create_git(root, commits, files, file_size, seed):
+    origin = os.path.join(root, 'git-origin.git')
+    seed_tree = os.path.join(root, 'git-seed')
+    clone = os.path.join(root, 'git-clone')
+    run(['git', 'init', '--quiet', '--bare', origin])
+    run(['git', 'init', '--quiet', seed_tree])
+
+    def commit(message):
+        run(['git', 'add', '--all'], seed_tree)
+        run(['git', 'commit', '--quiet', '-m', message], seed_tree)
+
+    populate(seed_tree, commits, files, file_size, seed, commit)
+    run(['git', 'push', '--quiet', file_url(origin), 'HEAD:refs/heads/master'], seed_tree)
+    run(['git', 'clone', '--quiet', '--branch', 'master', file_url(origin), clone])
+    return clone
+
+
+def create_mercurial(root, commits, files, file_size, seed):
+    origin = os.path.join(root, 'hg-origin')
+    clone = os.path.join(root, 'hg-clone')
+    run(['hg', 'init', origin])
+
+    def commit(message):
+        run(['hg', 'commit', '--addremove', '--quiet', '-m', message], origin)
+
+    populate(origin, commits, files, file_size, seed, commit)
+    run(['hg', 'clone', '--quiet', file_url(origin), clone])
+    return clone
+
+
+def create_svn(root, commits, files, file_size, seed):
+    origin = os.path.join(root, 'svn-origin')
+    seed_tree = os.path.join(root, 'svn-seed')
+    clone = os.path.join(root, 'svn-checkout')
+    run(['svnadmin', 'create', origin])
+    run(['svn', 'checkout', '--quiet', file_url(origin), seed_tree])
+
+    def commit(message):
+        run(['svn', 'add', '--quiet', '--force', '.'], seed_tree)
+        run(['svn', 'commit', '--quiet', '-m', message], seed_tree)
+
+    populate(seed_tree, commits, files, file_size, seed, commit)
+    run(['svn', 'checkout', '--quiet', file_url(origin), clone])
+    return clone
+
+
+CREATORS = {'git': create_git, 'mercurial': create_mercurial, 'svn': create_svn}
+
+
+def create(vcs_type, root, commits, files, file_size, seed=0):
+    return CREATORS[vcs_type](root, commits, files, file_size, seed)
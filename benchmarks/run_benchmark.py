@@ -0,0 +1,90 @@
+import argparse
+import shutil
+import sys
+import tempfile
+from config.config import server_mode
+from benchmarks import repositories, report
+from benchmarks.load import BenchmarkServer, drive
+
+DEFAULT_SCRIPTS = {
+    'git': ['status', 'log --limit 20', 'log --offset 50 --limit 20', 'search gamma', 'update'],
+    'mercurial': ['status', 'log --limit 20', 'log --offset 50 --limit 20', 'search gamma', 'update'],
+    'svn': ['status', 'log --limit 20', 'search gamma', 'update'],
+}
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='vcs-benchmark-')
+    parameters = {key: value for key, value in vars(args).items() if key != 'func'}
+    results = dict(report.environment(parameters), backends={})
+    server = None
+    try:
+        targets = {}
+        for vcs_type in args.vcs:
+            if not repositories.available(vcs_type):
+                results['backends'][vcs_type] = {'skipped': f"{repositories.VCS_TOOLS[vcs_type]} is not installed"}
+                continue
+            print(f"Creating {vcs_type} repository ({args.commits} commits, {args.files} files)...", flush=True)
+            targets[vcs_type] = repositories.create(vcs_type, workdir, args.commits, args.files, args.file_size,
+                                                    args.seed)
+
+        server = BenchmarkServer(workdir, args.mode).start()
+        for vcs_type, repo_path in targets.items():
+            script = args.script or DEFAULT_SCRIPTS[vcs_type]
+            print(f"Running {args.clients} {vcs_type} clients x {args.iterations} iterations...", flush=True)
+            drive(server.host, server.port, vcs_type, repo_path, script, args.clients, 1)
+            samples, errors, elapsed = drive(server.host, server.port, vcs_type, repo_path, script, args.clients,
+                                             args.iterations)
+            results['backends'][vcs_type] = report.summarize(samples, errors, elapsed)
+    finally:
+        if server is not None:
+            server.stop()
+        if args.keep:
+            print(f"Benchmark files kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(report.format_results(results))
+    if args.output:
+        report.save(results, args.output)
+        print(f"Results saved to {args.output}")
+    return 0
+
+
+def compare(args):
+    text, regressions = report.compare(report.load(args.baseline), report.load(args.current), args.tolerance)
+    print(text)
+    print(f"{regressions} regression(s) above {args.tolerance:.0%}.")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load benchmark for the VCS peer server.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="Create synthetic repositories and drive a peer with clients.")
+    run_parser.add_argument('--vcs', nargs='+', choices=sorted(repositories.CREATORS), default=sorted(repositories.CREATORS))
+    run_parser.add_argument('--mode', choices=['threaded', 'async'], default=server_mode)
+    run_parser.add_argument('--clients', type=int, default=8)
+    run_parser.add_argument('--iterations', type=int, default=20)
+    run_parser.add_argument('--commits', type=int, default=200)
+    run_parser.add_argument('--files', type=int, default=200)
+    run_parser.add_argument('--file-size', type=int, default=2048)
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--script', nargs='+', help="Commands each client repeats, in order.")
+    run_parser.add_argument('--output', help="Write the results as JSON to this file.")
+    run_parser.add_argument('--keep', action='store_true', help="Keep the generated repositories.")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser('compare', help="Compare two JSON result files.")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--tolerance', type=float, default=0.1)
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,72 @@
 backup_directory = r'C:/Users/Irina/kr'
+backup_chunk_size = 4194304
+backup_generations = 7
+backup_gc_grace = 3600
+history_full_every = 30
+history_chains = 2
+restore_workers = None
+restore_link_mode = 'reflink'
+restore_progress_interval = 1
 SI = 'localhost'
+peer_heartbeat_interval = 5
+peer_stale_after = 15
+peer_lookup_timeout = 5
+peer_routing = 'least_loaded'
+peer_affinity = False
+peer_redirect_threshold = 2
+peer_redirect_hops = 3
 db_name = 'db.sqlite'
+db_batch_size = 256
+db_busy_timeout = 30
+db_cached_statements = 128
 file_log = 'log_file.txt'
+metrics_interval = 60
+metrics_file = 'metrics.prom'
+metrics_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+metrics_top_repositories = 10
+profile_sessions = False
+profile_directory = 'profiles'
+profile_retention = 50
+profile_top_functions = 25
+server_mode = 'threaded'
+async_workers = 32
+batch_workers = 4
+command_queue_size = 64
+client_protocol = 'framed'
+handshake_timeout = 0.3
+frame_size = 16384
+max_frame_size = 1048576
+compression = ['zlib', 'lzma']
+compression_threshold = 4096
+compression_levels = {'zlib': 6, 'lzma': 1}
+git_pool_size = 32
+git_pool_idle_timeout = 300
+git_pool_log_limit = 200
+hg_cmdserver = True
+hg_pool_size = 16
+hg_pool_idle_timeout = 300
+hg_cmdserver_retry = 60
+status_cache_size = 64
+status_watch = 'auto'
+status_poll_interval = 2
+output_cache_bytes = 67108864
+output_cache_entry_bytes = 4194304
+output_cache_ttl = 300
+index_batch_size = 500
+index_query_limit = 100
+sar_workers = 16
+sar_cache_ttl = 30
+sar_page_size = 100
+fanout_workers = 8
+fanout_timeout = 120
+prefetch_enabled = True
+prefetch_interval = 900
+prefetch_jitter = 0.2
+prefetch_workers = 2
+prefetch_timeout = 600
+prefetch_max_backoff = 21600
+prefetch_fresh = 1800
+prefetch_tick = 5
 server_ports = [10001, 10002, 10003, 10004, 10005, 10006, 10007, 10008, 10009, 10010,
                 10011, 10012, 10013, 10014, 10015, 10016, 10017, 10018, 10019, 10020,
                 10021, 10022, 10023, 10024, 10025, 10026, 10027, 10028, 10029, 10030,
@@ -1,22 +1,92 @@
+import queue
 import sqlite3
+import threading
+from concurrent.futures import Future
 from datetime import datetime
+from config.config import db_batch_size, db_busy_timeout, db_cached_statements
 
 
 class DataBase:
     _instance = None
+    _lock = threading.Lock()
+    fts_enabled = False
 
     def __new__(cls, database_name):
-        if cls._instance is None:
-            cls._instance = super(DataBase, cls).__new__(cls)
-            cls._instance.database_name = database_name
-            cls._instance._connection = cls._instance.connect()
+        with cls._lock:
+            if cls._instance is None:
+                instance = super(DataBase, cls).__new__(cls)
+                instance.database_name = database_name
+                instance._local = threading.local()
+                instance._writes = queue.Queue()
+                instance._writer = threading.Thread(target=instance.run_writer, name='db-writer', daemon=True)
+                instance._writer.start()
+                cls._instance = instance
         return cls._instance
 
     def connect(self):
-        return sqlite3.connect(self.database_name)
+        connection = sqlite3.connect(self.database_name, timeout=db_busy_timeout,
+                                     cached_statements=db_cached_statements)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    @property
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self.connect()
+        return connection
+
+    def write(self, operation):
+        future = Future()
+        self._writes.put((operation, future))
+        return future.result()
+
+    def run_writer(self):
+        connection = self.connect()
+        connection.isolation_level = None
+        while True:
+            batch = [self._writes.get()]
+            while len(batch) < db_batch_size:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            self.commit_batch(connection, batch)
+
+    def commit_batch(self, connection, batch):
+        results = []
+        cursor = connection.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for operation, future in batch:
+                cursor.execute("SAVEPOINT operation")
+                try:
+                    results.append((future, operation(cursor), None))
+                    cursor.execute("RELEASE operation")
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO operation")
+                    cursor.execute("RELEASE operation")
+                    results.append((future, None, e))
+            cursor.execute("COMMIT")
+        except Exception as e:
+            if connection.in_transaction:
+                connection.rollback()
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            cursor.close()
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
 
     def create_tables(self):
-        cursor = self._connection.cursor()
+        self.write(self.create_schema)
+
+    def create_schema(self, cursor):
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS repositories (
                 id INTEGER PRIMARY KEY,
@@ -26,15 +96,95 @@ class DataBase:
                 repo_path TEXT
             )
         ''')
-        self._connection.commit()
-        cursor.close()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS commits (
+                id INTEGER PRIMARY KEY,
+                repo_path TEXT,
+                revision TEXT,
+                author TEXT,
+                date DATETIME,
+                message TEXT,
+                paths TEXT,
+                UNIQUE (repo_path, revision)
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS commits_author ON commits (repo_path, author)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS commits_date ON commits (repo_path, date)")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS commit_index_state (
+                repo_path TEXT PRIMARY KEY,
+                vcs_type TEXT,
+                head TEXT,
+                indexed_at DATETIME
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS history_snapshots (
+                id INTEGER PRIMARY KEY,
+                name TEXT,
+                sequence INTEGER,
+                repo_path TEXT,
+                vcs_type TEXT,
+                kind TEXT,
+                state TEXT,
+                path TEXT,
+                size INTEGER,
+                created_at DATETIME,
+                UNIQUE (name, sequence)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS prefetch_state (
+                repo_path TEXT PRIMARY KEY,
+                vcs_type TEXT,
+                next_run REAL,
+                last_fetch REAL,
+                failures INTEGER DEFAULT 0,
+                last_error TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS peers (
+                port INTEGER PRIMARY KEY,
+                pid INTEGER,
+                host TEXT,
+                started_at DATETIME,
+                heartbeat REAL
+            )
+        ''')
+        self.add_missing_columns(cursor, 'peers', {'sessions': 'INTEGER DEFAULT 0', 'subprocesses': 'INTEGER DEFAULT 0',
+                                                   'queue_depth': 'INTEGER DEFAULT 0'})
+        cursor.execute("CREATE INDEX IF NOT EXISTS peers_heartbeat ON peers (heartbeat)")
+        cursor.execute("SAVEPOINT fts")
+        try:
+            cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS commits_fts USING fts5(message, content='commits', content_rowid='id')")
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS commits_fts_insert AFTER INSERT ON commits BEGIN
+                    INSERT INTO commits_fts (rowid, message) VALUES (new.id, new.message);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS commits_fts_delete AFTER DELETE ON commits BEGIN
+                    INSERT INTO commits_fts (commits_fts, rowid, message) VALUES ('delete', old.id, old.message);
+                END
+            ''')
+            cursor.execute("RELEASE fts")
+            self.fts_enabled = True
+        except sqlite3.OperationalError:
+            cursor.execute("ROLLBACK TO fts")
+            cursor.execute("RELEASE fts")
+            self.fts_enabled = False
+
+    def add_missing_columns(self, cursor, table, columns):
+        existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+        for name, definition in columns.items():
+            if name not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
 
     def insert_repository(self, name, vcs_type, repo):
-        cursor = self._connection.cursor()
-        cursor.execute("INSERT INTO repositories (name, vcs_type, created_at, repo_path) VALUES (?, ?, ?, ?)",
-                       (name, vcs_type, datetime.now(), repo))
-        self._connection.commit()
-        cursor.close()
+        self.write(lambda cursor: cursor.execute(
+            "INSERT INTO repositories (name, vcs_type, created_at, repo_path) VALUES (?, ?, ?, ?)",
+            (name, vcs_type, datetime.now(), repo)))
 
     def fetch_active_repositories(self):
         cursor = self._connection.cursor()
@@ -44,7 +194,162 @@ class DataBase:
         return repositories
 
     def remove_repository(self, name):
+        self.write(lambda cursor: cursor.execute("DELETE FROM repositories WHERE name=?", (name,)))
+
+    def remove_repositories(self, names):
+        rows = [(name,) for name in names]
+        self.write(lambda cursor: cursor.executemany("DELETE FROM repositories WHERE name=?", rows))
+
+    def indexed_head(self, repo_path):
         cursor = self._connection.cursor()
-        cursor.execute("DELETE FROM repositories WHERE name=?", (name,))
-        self._connection.commit()
-        cursor.close()
\ No newline at end of file
+        cursor.execute("SELECT head FROM commit_index_state WHERE repo_path=?", (repo_path,))
+        row = cursor.fetchone()
+        cursor.close()
+        return row[0] if row else None
+
+    def set_indexed_head(self, repo_path, vcs_type, head):
+        self.write(lambda cursor: cursor.execute(
+            "INSERT OR REPLACE INTO commit_index_state (repo_path, vcs_type, head, indexed_at) VALUES (?, ?, ?, ?)",
+            (repo_path, vcs_type, head, datetime.now())))
+
+    def insert_commits(self, repo_path, commits):
+        rows = [(repo_path, commit.revision, commit.author, commit.date, commit.message, '\n'.join(commit.paths))
+                for commit in commits]
+        self.write(lambda cursor: cursor.executemany(
+            "INSERT OR IGNORE INTO commits (repo_path, revision, author, date, message, paths) VALUES (?, ?, ?, ?, ?, ?)",
+            rows))
+
+    def clear_commits(self, repo_path):
+        def clear(cursor):
+            cursor.execute("DELETE FROM commits WHERE repo_path=?", (repo_path,))
+            cursor.execute("DELETE FROM commit_index_state WHERE repo_path=?", (repo_path,))
+        self.write(clear)
+
+    def search_commits(self, repo_path, text, limit):
+        cursor = self._connection.cursor()
+        if self.fts_enabled:
+            cursor.execute("SELECT c.revision, c.author, c.date, c.message FROM commits_fts "
+                           "JOIN commits c ON c.id = commits_fts.rowid "
+                           "WHERE commits_fts MATCH ? AND c.repo_path=? ORDER BY c.date DESC LIMIT ?",
+                           ('"' + text.replace('"', '""') + '"', repo_path, limit))
+        else:
+            cursor.execute("SELECT revision, author, date, message FROM commits "
+                           "WHERE repo_path=? AND message LIKE ? ORDER BY date DESC LIMIT ?",
+                           (repo_path, f"%{text}%", limit))
+        commits = cursor.fetchall()
+        cursor.close()
+        return commits
+
+    def query_commits(self, repo_path, author=None, since=None, until=None, limit=None, offset=None):
+        query = "SELECT revision, author, date, message FROM commits WHERE repo_path=?"
+        parameters = [repo_path]
+        if author is not None:
+            query += " AND author LIKE ?"
+            parameters.append(f"%{author}%")
+        if since is not None:
+            query += " AND date >= ?"
+            parameters.append(since)
+        if until is not None:
+            query += " AND date <= ?"
+            parameters.append(until)
+        query += " ORDER BY date DESC LIMIT ? OFFSET ?"
+        parameters += [limit if limit is not None else -1, offset or 0]
+
+        cursor = self._connection.cursor()
+        cursor.execute(query, parameters)
+        commits = cursor.fetchall()
+        cursor.close()
+        return commits
+
+    def insert_history_snapshot(self, name, sequence, repo_path, vcs_type, kind, state, path, size):
+        self.write(lambda cursor: cursor.execute(
+            "INSERT INTO history_snapshots (name, sequence, repo_path, vcs_type, kind, state, path, size, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (name, sequence, repo_path, vcs_type, kind, state, path, size, datetime.now())))
+
+    def fetch_history_snapshots(self, name):
+        cursor = self._connection.cursor()
+        cursor.execute("SELECT sequence, repo_path, vcs_type, kind, state, path, size, created_at "
+                       "FROM history_snapshots WHERE name=? ORDER BY sequence", (name,))
+        snapshots = cursor.fetchall()
+        cursor.close()
+        return snapshots
+
+    def fetch_history_names(self):
+        cursor = self._connection.cursor()
+        cursor.execute("SELECT name, vcs_type, MAX(sequence), SUM(size) FROM history_snapshots GROUP BY name ORDER BY name")
+        names = cursor.fetchall()
+        cursor.close()
+        return names
+
+    def remove_history_snapshots(self, name, before_sequence):
+        self.write(lambda cursor: cursor.execute(
+            "DELETE FROM history_snapshots WHERE name=? AND sequence<?", (name, before_sequence)))
+
+    def register_peer(self, port, pid, host, heartbeat):
+        self.write(lambda cursor: cursor.execute(
+            "INSERT OR REPLACE INTO peers (port, pid, host, started_at, heartbeat) VALUES (?, ?, ?, ?, ?)",
+            (port, pid, host, datetime.now(), heartbeat)))
+
+    def heartbeat_peer(self, port, pid, heartbeat, load=(0, 0, 0)):
+        return self.write(lambda cursor: cursor.execute(
+            "UPDATE peers SET heartbeat=?, sessions=?, subprocesses=?, queue_depth=? WHERE port=? AND pid=?",
+            (heartbeat, *load, port, pid)).rowcount)
+
+    def unregister_peer(self, port, pid):
+        self.write(lambda cursor: cursor.execute("DELETE FROM peers WHERE port=? AND pid=?", (port, pid)))
+
+    def reap_peers(self, cutoff):
+        return self.write(lambda cursor: cursor.execute("DELETE FROM peers WHERE heartbeat<?", (cutoff,)).rowcount)
+
+    def fetch_live_peers(self, cutoff):
+        cursor = self._connection.cursor()
+        cursor.execute("SELECT port, pid, host FROM peers WHERE heartbeat>=? ORDER BY port", (cutoff,))
+        peers = cursor.fetchall()
+        cursor.close()
+        return peers
+
+    def find_least_loaded_peer(self, cutoff):
+        cursor = self._connection.cursor()
+        cursor.execute("SELECT port, pid, host, sessions + subprocesses + queue_depth AS load FROM peers "
+                       "WHERE heartbeat>=? ORDER BY load, heartbeat DESC LIMIT 1", (cutoff,))
+        peer = cursor.fetchone()
+        cursor.close()
+        return peer
+
+    def find_peer(self, pid, cutoff):
+        cursor = self._connection.cursor()
+        cursor.execute("SELECT port, pid, host FROM peers WHERE heartbeat>=? ORDER BY pid=? DESC, heartbeat DESC LIMIT 1",
+                       (cutoff, pid))
+        peer = cursor.fetchone()
+        cursor.close()
+        return peer
+
+    def fetch_prefetch_states(self):
+        cursor = self._connection.cursor()
+        cursor.execute("SELECT repo_path, vcs_type, next_run, last_fetch, failures FROM prefetch_state")
+        states = cursor.fetchall()
+        cursor.close()
+        return states
+
+    def insert_prefetch_state(self, repo_path, vcs_type, next_run):
+        self.write(lambda cursor: cursor.execute(
+            "INSERT OR IGNORE INTO prefetch_state (repo_path, vcs_type, next_run) VALUES (?, ?, ?)",
+            (repo_path, vcs_type, next_run)))
+
+    def claim_prefetch(self, repo_path, now, lease_until):
+        return self.write(lambda cursor: cursor.execute(
+            "UPDATE prefetch_state SET next_run=? WHERE repo_path=? AND next_run<=?",
+            (lease_until, repo_path, now)).rowcount)
+
+    def record_prefetch(self, repo_path, next_run, last_fetch, failures, error):
+        self.write(lambda cursor: cursor.execute(
+            "UPDATE prefetch_state SET next_run=?, last_fetch=COALESCE(?, last_fetch), failures=?, last_error=? "
+            "WHERE repo_path=?", (next_run, last_fetch, failures, error, repo_path)))
+
+    def last_prefetch(self, repo_path):
+        cursor = self._connection.cursor()
+        cursor.execute("SELECT last_fetch FROM prefetch_state WHERE repo_path=?", (repo_path,))
+        row = cursor.fetchone()
+        cursor.close()
+        return row[0] if row else None
@@ -0,0 +1,60 @@
+import importlib
+import logging
+import threading
+import time
+from collections import namedtuple
+
+Backend = namedtuple('Backend', ['name', 'module', 'class_name', 'db_name', 'marker', 'aliases', 'prefetch'])
+
+_backends = {}
+_classes = {}
+_lock = threading.Lock()
+
+
+def register(name, module, class_name, db_name, marker, aliases=(), prefetch=False):
+    with _lock:
+        _backends[name] = Backend(name, module, class_name, db_name, marker, tuple(aliases), prefetch)
+        _classes.pop(name, None)
+
+
+def names():
+    return list(_backends)
+
+
+def resolve(name):
+    name = name.lower()
+    for backend in _backends.values():
+        if name == backend.name or name in backend.aliases:
+            return backend.name
+    return None
+
+
+def get(name):
+    backend = _backends.get(name)
+    if backend is None:
+        raise ValueError(f"Unsupported VCS Type: {name}")
+    return backend
+
+
+def by_db_name(db_name):
+    for backend in _backends.values():
+        if backend.db_name == db_name:
+            return backend
+    return None
+
+
+def load(name):
+    backend = get(name)
+    with _lock:
+        implementation = _classes.get(name)
+        if implementation is None:
+            started = time.monotonic()
+            implementation = getattr(importlib.import_module(backend.module), backend.class_name)
+            _classes[name] = implementation
+            logging.info(f"Loaded {name} backend from {backend.module} in {time.monotonic() - started:.3f}s")
+    return implementation
+
+
+register('git', 'modules.gitt', 'GIT', 'Git', '.git', prefetch=True)
+register('mercurial', 'modules.mercurial', 'Mercurial', 'Mercurial', '.hg', aliases=('hg',), prefetch=True)
+register('svn', 'modules.svn', 'SVN', 'SVN', '.svn')
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from config.config import backup_directory, backup_chunk_size, backup_generations, backup_gc_grace, restore_workers
+from modules import restore
+
+
+def backup_name(repo_path):
+    root = os.path.abspath(repo_path)
+    digest = hashlib.sha256(os.fsencode(root)).hexdigest()[:8]
+    return f"{os.path.basename(root) or 'root'}-{digest}"
+
+
+class BackupStore:
+    def __init__(self, root=backup_directory, chunk_size=backup_chunk_size, generations=backup_generations):
+        self.root = root
+        self.chunk_size = chunk_size
+        self.generations = generations
+        self.chunks_dir = os.path.join(root, 'chunks')
+        self.manifests_dir = os.path.join(root, 'manifests')
+
+    def chunk_path(self, digest):
+        return os.path.join(self.chunks_dir, digest[:2], digest)
+
+    def manifest_path(self, name, snapshot_id):
+        return os.path.join(self.manifests_dir, name, f"{snapshot_id}.json")
+
+    def list_snapshots(self, name):
+        directory = os.path.join(self.manifests_dir, name)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(entry[:-5] for entry in os.listdir(directory) if entry.endswith('.json'))
+
+    def list_backups(self):
+        if not os.path.isdir(self.manifests_dir):
+            return {}
+        return {name: self.list_snapshots(name) for name in sorted(os.listdir(self.manifests_dir))}
+
+    def load_manifest(self, name, snapshot_id=None):
+        if snapshot_id is None:
+            snapshots = self.list_snapshots(name)
+            if not snapshots:
+                return None
+            snapshot_id = snapshots[-1]
+        path = self.manifest_path(name, snapshot_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as manifest_file:
+            return json.load(manifest_file)
+
+    def create_snapshot(self, repo_path):
+        name = backup_name(repo_path)
+        previous = self.load_manifest(name)
+        previous_files = {entry['path']: entry for entry in previous['files']} if previous else {}
+        snapshot_id = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        manifest = {'name': name, 'snapshot': snapshot_id, 'repo_path': os.path.abspath(repo_path),
+                    'created_at': datetime.now().isoformat(), 'dirs': [], 'files': [], 'symlinks': []}
+        stats = {'files': 0, 'hashed_files': 0, 'new_chunks': 0, 'new_bytes': 0, 'total_bytes': 0}
+
+        for dirpath, dirnames, filenames in os.walk(repo_path):
+            relative_dir = os.path.relpath(dirpath, repo_path)
+            for dirname in list(dirnames):
+                full_path = os.path.join(dirpath, dirname)
+                if os.path.islink(full_path):
+                    dirnames.remove(dirname)
+                    filenames.append(dirname)
+                else:
+                    manifest['dirs'].append(os.path.normpath(os.path.join(relative_dir, dirname)))
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                relative_path = os.path.normpath(os.path.join(relative_dir, filename))
+                if os.path.islink(full_path):
+                    manifest['symlinks'].append({'path': relative_path, 'target': os.readlink(full_path)})
+                    continue
+                manifest['files'].append(self.store_file(full_path, relative_path, previous_files, stats))
+
+        self.write_manifest(manifest)
+        self.prune(name)
+        return manifest, stats
+
+    def store_file(self, full_path, relative_path, previous_files, stats):
+        stat = os.stat(full_path)
+        stats['files'] += 1
+        stats['total_bytes'] += stat.st_size
+        entry = {'path': relative_path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                 'mode': stat.st_mode & 0o7777}
+        previous = previous_files.get(relative_path)
+        if (previous is not None and previous['size'] == stat.st_size and previous['mtime_ns'] == stat.st_mtime_ns
+                and all(self.touch_chunk(digest) for digest in previous['chunks'])):
+            entry['chunks'] = previous['chunks']
+            return entry
+
+        stats['hashed_files'] += 1
+        entry['chunks'] = []
+        with open(full_path, 'rb') as source:
+            while True:
+                data = source.read(self.chunk_size)
+                if not data:
+                    break
+                digest = hashlib.sha256(data).hexdigest()
+                if self.store_chunk(digest, data):
+                    stats['new_chunks'] += 1
+                    stats['new_bytes'] += len(data)
+                entry['chunks'].append(digest)
+        return entry
+
+    def touch_chunk(self, digest):
+        try:
+            os.utime(self.chunk_path(digest))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def store_chunk(self, digest, data):
+        path = self.chunk_path(digest)
+        if self.touch_chunk(digest):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(descriptor, 'wb') as chunk_file:
+            chunk_file.write(data)
+        os.replace(temporary_path, path)
+        return True
+
+    def write_manifest(self, manifest):
+        path = self.manifest_path(manifest['name'], manifest['snapshot'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(temporary_path, path)
+
+    def prune(self, name):
+        snapshots = self.list_snapshots(name)
+        expired = snapshots[:-self.generations] if self.generations > 0 else []
+        for snapshot_id in expired:
+            os.remove(self.manifest_path(name, snapshot_id))
+        if expired:
+            self.collect_garbage()
+
+    def collect_garbage(self):
+        referenced = set()
+        for name, snapshots in self.list_backups().items():
+            for snapshot_id in snapshots:
+                manifest = self.load_manifest(name, snapshot_id)
+                for entry in manifest['files']:
+                    referenced.update(entry['chunks'])
+
+        deadline = time.time() - backup_gc_grace
+        removed = 0
+        if not os.path.isdir(self.chunks_dir):
+            return removed
+        for prefix in os.listdir(self.chunks_dir):
+            directory = os.path.join(self.chunks_dir, prefix)
+            for digest in os.listdir(directory):
+                path = os.path.join(directory, digest)
+                if digest not in referenced and os.path.getmtime(path) < deadline:
+                    os.remove(path)
+                    removed += 1
+        return removed
+
+    def restore(self, manifest, target, paths=None, progress=None):
+        paths = restore.normalize_paths(paths)
+        os.makedirs(target, exist_ok=True)
+        for directory in manifest['dirs']:
+            if restore.selected(directory, paths):
+                os.makedirs(os.path.join(target, directory), exist_ok=True)
+        tasks = [(entry['size'], lambda entry=entry: self.restore_file(entry, os.path.join(target, entry['path'])))
+                 for entry in manifest['files'] if restore.selected(entry['path'], paths)]
+        restored = restore.run_parallel(tasks, progress, restore_workers or restore.default_workers(target))
+        for link in manifest['symlinks']:
+            if not restore.selected(link['path'], paths):
+                continue
+            destination = os.path.join(target, link['path'])
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            if os.path.lexists(destination):
+                os.remove(destination)
+            os.symlink(link['target'], destination)
+        return restored
+
+    def restore_file(self, entry, destination):
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        if os.path.lexists(destination):
+            os.remove(destination)
+        target_fd = os.open(destination, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | restore.O_BINARY, 0o600)
+        try:
+            offset = 0
+            for digest in entry['chunks']:
+                chunk_fd = os.open(self.chunk_path(digest), os.O_RDONLY | restore.O_BINARY)
+                try:
+                    length = os.fstat(chunk_fd).st_size
+                    if restore.copy_range(chunk_fd, target_fd, length, 0, offset) != length:
+                        raise OSError(f"Short copy of chunk {digest} into {destination}")
+                    offset += length
+                finally:
+                    os.close(chunk_fd)
+        finally:
+            os.close(target_fd)
+        os.chmod(destination, entry['mode'])
+        os.utime(destination, ns=(entry['mtime_ns'], entry['mtime_ns']))
+        return entry['size']
+
+
+def parse_backup_name(backup_name):
+    name, _, snapshot_id = backup_name.partition('@')
+    return name, snapshot_id or None
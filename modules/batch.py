@@ -0,0 +1,135 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from config.config import batch_workers
+from modules.metrics import metrics
+
+BATCH_SEPARATOR = ';'
+ERROR_PREFIXES = (b'Error', b'Invalid')
+READ_ONLY_COMMANDS = {'status', 'log', 'search', 'list', 'help', 'backups'}
+
+batch_executor = ThreadPoolExecutor(max_workers=batch_workers, thread_name_prefix='batch')
+
+
+def split_batch(message):
+    commands = []
+    current = []
+    quote = None
+    for char in message:
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char in ('"', "'") and (not current or current[-1].isspace()):
+            quote = char
+            opened = len(current)
+        elif char == BATCH_SEPARATOR:
+            commands.append(''.join(current))
+            current = []
+            continue
+        current.append(char)
+    if quote is not None and BATCH_SEPARATOR in current[opened:]:
+        raise ValueError(f"Unterminated {quote} quote in batch")
+    commands.append(''.join(current))
+    return [command.strip() for command in commands if command.strip()]
+
+
+def is_read_only(command):
+    return command.split(maxsplit=1)[0].lower() in READ_ONLY_COMMANDS
+
+
+def plan(commands):
+    groups = []
+    for command in commands:
+        read_only = is_read_only(command)
+        if read_only and groups and groups[-1][0]:
+            groups[-1][1].append(command)
+        else:
+            groups.append((read_only, [command]))
+    return groups
+
+
+class ResponseMonitor:
+    def __init__(self, client_socket):
+        self.client_socket = client_socket
+        self.failed = False
+        self.terminated = True
+
+    def sendall(self, data):
+        if not data:
+            return
+        metrics.bytes_sent(len(data))
+        if bytes(data[:16]).lstrip().startswith(ERROR_PREFIXES):
+            self.failed = True
+        self.terminated = data.endswith(b'\n')
+        self.forward(data)
+
+    def forward(self, data):
+        self.client_socket.sendall(data)
+
+    def __getattr__(self, name):
+        return getattr(self.client_socket, name)
+
+
+class CaptureSocket(ResponseMonitor):
+    def __init__(self, client_socket):
+        super().__init__(client_socket)
+        self.chunks = []
+
+    def forward(self, data):
+        self.chunks.append(bytes(data))
+
+    def getvalue(self):
+        return b''.join(self.chunks) + (b'' if self.terminated else b'\n')
+
+
+def stop_message(command, skipped):
+    return f"\nBatch stopped: '{command}' failed, skipped {skipped} remaining command(s).\n".encode('utf-8')
+
+
+def run_batch(client_socket, commands, execute):
+    completed = 0
+    for read_only, group in plan(commands):
+        if read_only and len(group) > 1:
+            captures = [CaptureSocket(client_socket) for _ in group]
+            list(batch_executor.map(metrics.enqueued(execute), captures, group))
+            for command, capture in zip(group, captures):
+                client_socket.sendall(capture.getvalue())
+                completed += 1
+                if capture.failed and completed < len(commands):
+                    client_socket.sendall(stop_message(command, len(commands) - completed))
+                    return False
+            continue
+        for command in group:
+            monitor = ResponseMonitor(client_socket)
+            execute(monitor, command)
+            if not monitor.terminated and len(commands) > 1:
+                client_socket.sendall(b'\n')
+            completed += 1
+            if monitor.failed and completed < len(commands):
+                client_socket.sendall(stop_message(command, len(commands) - completed))
+                return False
+    return True
+
+
+async def run_batch_async(client_socket, commands, execute):
+    completed = 0
+    for read_only, group in plan(commands):
+        if read_only and len(group) > 1:
+            captures = [CaptureSocket(client_socket) for _ in group]
+            await asyncio.gather(*(execute(capture, command) for capture, command in zip(captures, group)))
+            for command, capture in zip(group, captures):
+                await client_socket.send(capture.getvalue())
+                completed += 1
+                if capture.failed and completed < len(commands):
+                    await client_socket.send(stop_message(command, len(commands) - completed))
+                    return False
+            continue
+        for command in group:
+            monitor = ResponseMonitor(client_socket)
+            await execute(monitor, command)
+            if not monitor.terminated and len(commands) > 1:
+                await client_socket.send(b'\n')
+            completed += 1
+            if monitor.failed and completed < len(commands):
+                await client_socket.send(stop_message(command, len(commands) - completed))
+                return False
+    return True
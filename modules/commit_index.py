@@ -0,0 +1,125 @@
+import codecs
+import os
+import re
+import subprocess
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from config.config import index_batch_size, index_query_limit
+
+Commit = namedtuple('Commit', ['revision', 'author', 'date', 'message', 'paths'])
+
+RECORD_SEPARATOR = '\x1e'
+FIELD_SEPARATOR = '\x1f'
+
+RELATIVE_DATE = re.compile(r'^(\d+)[ .]+(second|minute|hour|day|week|month|year)s?[ .]+ago$')
+RELATIVE_UNITS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400, 'week': 7 * 86400, 'month': 30 * 86400,
+                  'year': 365 * 86400}
+DATE_ONLY = '%Y-%m-%d'
+DATE_FORMATS = (DATE_ONLY, '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M')
+
+
+def format_timestamp(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def parse_date(value, end_of_day=False):
+    text = value.strip().lower()
+    now = datetime.now(timezone.utc)
+    if text == 'now':
+        return format_timestamp(now.timestamp())
+    if text in ('today', 'yesterday'):
+        day = datetime.now().astimezone().replace(hour=0, minute=0, second=0, microsecond=0)
+        if text == 'yesterday':
+            day -= timedelta(days=1)
+        if end_of_day:
+            day += timedelta(days=1, seconds=-1)
+        return format_timestamp(day.timestamp())
+    match = RELATIVE_DATE.match(text)
+    if match:
+        return format_timestamp(now.timestamp() - int(match.group(1)) * RELATIVE_UNITS[match.group(2)])
+    for date_format in DATE_FORMATS:
+        try:
+            moment = datetime.strptime(value.strip(), date_format)
+        except ValueError:
+            continue
+        if date_format == DATE_ONLY and end_of_day:
+            moment += timedelta(days=1, seconds=-1)
+        break
+    else:
+        try:
+            moment = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+        except ValueError:
+            raise ValueError(f"Invalid date '{value}'")
+    if moment.tzinfo is None:
+        moment = moment.astimezone()
+    return format_timestamp(moment.timestamp())
+
+
+def iter_records(chunks):
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    pending = ''
+    for chunk in chunks:
+        records = (pending + decoder.decode(chunk)).split(RECORD_SEPARATOR)
+        pending = records.pop()
+        for record in records:
+            if record:
+                yield record
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+def refresh(vcs, repo_path):
+    root = os.path.abspath(repo_path)
+    head = vcs.history_head(repo_path)
+    last = vcs.database.indexed_head(root)
+    if head == last:
+        return 0
+    try:
+        indexed = store(vcs, root, vcs.iter_commits(repo_path, last))
+    except subprocess.CalledProcessError:
+        if last is None:
+            raise
+        vcs.database.clear_commits(root)
+        indexed = store(vcs, root, vcs.iter_commits(repo_path, None))
+    vcs.database.set_indexed_head(root, vcs.vcs_type, head)
+    return indexed
+
+
+def store(vcs, root, commits):
+    indexed = 0
+    batch = []
+    for commit in commits:
+        batch.append(commit)
+        if len(batch) >= index_batch_size:
+            vcs.database.insert_commits(root, batch)
+            indexed += len(batch)
+            batch = []
+    if batch:
+        vcs.database.insert_commits(root, batch)
+        indexed += len(batch)
+    return indexed
+
+
+def search(vcs, repo_path, text, limit=index_query_limit):
+    refresh(vcs, repo_path)
+    send_commits(vcs.client_socket, vcs.database.search_commits(os.path.abspath(repo_path), text, limit))
+
+
+def query(vcs, repo_path, author=None, since=None, until=None, limit=None, offset=None):
+    since = parse_date(since) if since is not None else None
+    until = parse_date(until, end_of_day=True) if until is not None else None
+    refresh(vcs, repo_path)
+    commits = vcs.database.query_commits(os.path.abspath(repo_path), author=author, since=since, until=until,
+                                         limit=limit if limit is not None else index_query_limit, offset=offset)
+    send_commits(vcs.client_socket, commits)
+
+
+def send_commits(client_socket, commits):
+    if not commits:
+        client_socket.sendall(b"No matching commits found.\n")
+        return
+    response = ''.join(f"Commit: {revision}\nAuthor: {author}\nDate: {date}\nMessage: {message.strip()}\n\n"
+                       for revision, author, date, message in commits)
+    client_socket.sendall(response.encode('utf-8'))
@@ -1,42 +1,92 @@
+from modules import commit_index, history_backup
+from modules.factories import VCSFA
+from modules.observer import repository_events
+from modules.output_cache import output_cache
+
+
 class VCSF:
     def __init__(self, vcs_adapter):
         self.adapter = vcs_adapter
 
+    def with_socket(self, client_socket):
+        return VCSF(VCSFA().create_vcs(client_socket, self.adapter.vcs_type, self.adapter.database))
+
+    def changed(self, repo_path):
+        if repo_path is not None:
+            repository_events.notify(repo_path)
+
     def commit_changes(self, repo_path, comment):
         self.adapter.commit(repo_path, comment)
+        self.changed(repo_path)
 
     def update_repository(self, repo_path):
         self.adapter.update(repo_path)
+        self.changed(repo_path)
 
     def push_changes(self, repo_path):
         self.adapter.push(repo_path)
+        self.changed(repo_path)
 
     def initialize_repository(self, repository_name, repo_path):
         self.adapter.init_repo(repository_name, repo_path)
+        self.changed(repo_path)
+
+    def cached(self, command, repo_path, arguments, produce):
+        try:
+            revision = self.adapter.cache_revision(repo_path) if repo_path is not None else None
+        except Exception:
+            revision = None
+        if not revision:
+            produce(self.adapter)
+            return
+        output_cache.get(self.adapter.client_socket, repo_path, self.adapter.vcs_type, revision, command, arguments,
+                         lambda tee: produce(VCSFA().create_vcs(tee, self.adapter.vcs_type, self.adapter.database)))
+
+    def view_commit_history(self, repo_path, limit=None, offset=None, since=None, until=None, path=None):
+        options = {'limit': limit, 'offset': offset, 'since': since, 'until': until, 'path': path}
+        self.cached('log', repo_path, options, lambda adapter: adapter.log(repo_path, **options))
+
+    def search_commit_history(self, repo_path, text):
+        commit_index.search(self.adapter, repo_path, text)
+
+    def query_commit_history(self, repo_path, author=None, since=None, until=None, limit=None, offset=None):
+        commit_index.query(self.adapter, repo_path, author=author, since=since, until=until, limit=limit, offset=offset)
+
+    def backup_history(self, repo_path):
+        history_backup.backup(self.adapter, repo_path)
+
+    def list_history_backups(self):
+        return self.adapter.database.fetch_history_names()
 
-    def view_commit_history(self, repo_path):
-        self.adapter.log(repo_path)
+    def load_history_backup(self, name, sequence, target):
+        history_backup.load(self.adapter, name, sequence, target)
 
     def view_repository_status(self, repo_path):
         self.adapter.status(repo_path)
 
     def add_files(self, repo_path, files):
         self.adapter.add(repo_path, files)
+        self.changed(repo_path)
 
     def add_all_changes(self, repo_path):
         self.adapter.add_all(repo_path)
+        self.changed(repo_path)
 
     def apply_patch(self, repo_path, patch_file_path):
         self.adapter.patch(repo_path, patch_file_path)
+        self.changed(repo_path)
 
     def create_branch(self, repo_path, branch_name):
         self.adapter.branch(repo_path, branch_name)
+        self.changed(repo_path)
 
     def merge_branch(self, repo_path, branch_name):
         self.adapter.merge(repo_path, branch_name)
+        self.changed(repo_path)
 
     def create_tag(self, repo_path, tag_name):
         self.adapter.tag(repo_path, tag_name)
+        self.changed(repo_path)
 
     def list(self, repo_path):
-        self.adapter.list(repo_path)
+        self.cached('list', repo_path, {}, lambda adapter: adapter.list(repo_path))
@@ -0,0 +1,98 @@
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from config.config import fanout_workers, fanout_timeout
+from modules import backends, process
+from modules.metrics import metrics
+from modules.batch import CaptureSocket
+from modules.facade import VCSF
+from modules.factories import VCSFA
+from modules.visitor import command_executor
+from utils.utils import check_repository
+
+EXCLUDED_COMMANDS = {'init', 'backup_load', 'help'}
+VCS_OPTION = re.compile(r'(?:^|\s)--vcs\s+(\S+)')
+
+
+def parse_fanout(command):
+    _, _, rest = command.strip().partition(' ')
+    vcs_filter = None
+    match = VCS_OPTION.search(rest)
+    if match is not None:
+        vcs_filter = backends.resolve(match.group(1))
+        if vcs_filter is None:
+            raise ValueError(f"Unsupported VCS type '{match.group(1)}'")
+        rest = (rest[:match.start()] + rest[match.end():]).strip()
+    if not rest:
+        raise ValueError(f"Usage: all <command> [--vcs {'|'.join(backends.names())}]")
+    if rest.split()[0].lower() in EXCLUDED_COMMANDS:
+        raise ValueError(f"'{rest.split()[0]}' cannot be run across repositories")
+    return vcs_filter, rest
+
+
+def run_on_repository(database, vcs_type, repo_path, command, started, position):
+    started[position] = time.monotonic()
+    capture = CaptureSocket(None)
+    facade = VCSF(VCSFA().create_vcs(capture, vcs_type, database))
+    with process.time_limit(fanout_timeout):
+        command_executor.visit(capture, vcs_type, command, facade, repo_path)
+    return capture
+
+
+def fan_out(database, client_socket, command):
+    try:
+        vcs_filter, repo_command = parse_fanout(command)
+    except ValueError as e:
+        client_socket.sendall(f"Error executing 'all' command: {e}\n".encode('utf-8'))
+        return
+
+    targets = []
+    skipped = 0
+    for repository in database.fetch_active_repositories():
+        name, db_vcs_type, repo_path = repository
+        backend = backends.by_db_name(db_vcs_type)
+        vcs_type = backend.name if backend is not None else None
+        if vcs_type is None or (vcs_filter is not None and vcs_type != vcs_filter):
+            continue
+        if not check_repository(repository):
+            client_socket.sendall(f"=== {name} ({vcs_type}) {repo_path}: skipped, repository is missing ===\n"
+                                  .encode('utf-8'))
+            skipped += 1
+            continue
+        targets.append((name, vcs_type, repo_path))
+
+    counts = {'ok': 0, 'failed': 0, 'timed out': 0}
+    started = {}
+    executor = ThreadPoolExecutor(max_workers=fanout_workers, thread_name_prefix='fanout')
+    pending = {executor.submit(metrics.enqueued(run_on_repository), database, vcs_type, repo_path, repo_command, started, position):
+               position for position, (_, vcs_type, repo_path) in enumerate(targets)}
+
+    def report(position, status, output=b''):
+        name, vcs_type, repo_path = targets[position]
+        elapsed = time.monotonic() - started.get(position, time.monotonic())
+        counts[status] += 1
+        client_socket.sendall(f"=== {name} ({vcs_type}) {repo_path}: {status} in {elapsed:.1f}s ===\n".encode('utf-8')
+                              + output)
+
+    try:
+        while pending:
+            done, _ = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+            for future in done:
+                position = pending.pop(future)
+                try:
+                    capture = future.result()
+                    report(position, 'failed' if capture.failed else 'ok', capture.getvalue())
+                except Exception as e:
+                    report(position, 'failed', f"Error executing '{repo_command}' command: {e}\n".encode('utf-8'))
+            now = time.monotonic()
+            for future, position in list(pending.items()):
+                if position in started and now - started[position] > fanout_timeout:
+                    del pending[future]
+                    report(position, 'timed out')
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    client_socket.sendall(f"Ran '{repo_command}' on {len(targets)} repositories: {counts['ok']} ok, "
+                          f"{counts['failed']} failed, {counts['timed out']} timed out, {skipped} skipped.\n"
+                          .encode('utf-8'))
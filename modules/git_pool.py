@@ -0,0 +1,76 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+
+import git
+from config.config import git_pool_size, git_pool_idle_timeout
+from modules.pool import HelperPool
+
+
+class GitHelper:
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self.repo = git.Repo(repo_path)
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+    def alive(self):
+        if not os.path.isdir(self.repo.git_dir):
+            return False
+        for command in (self.repo.git.cat_file_all, self.repo.git.cat_file_header):
+            if command is not None and command.proc.poll() is not None:
+                return False
+        return True
+
+    def head_revision(self):
+        return self.repo.head.commit.hexsha
+
+    def log(self, limit, offset=0):
+        head = self.repo.head.commit
+        order = itertools.count()
+        queue = [(-head.committed_date, next(order), head)]
+        seen = {head.binsha}
+        commits = []
+        while queue and len(commits) < offset + limit:
+            _, _, commit = heapq.heappop(queue)
+            commits.append(commit)
+            for parent in commit.parents:
+                if parent.binsha not in seen:
+                    seen.add(parent.binsha)
+                    heapq.heappush(queue, (-parent.committed_date, next(order), parent))
+        return '\n'.join(format_commit(commit) for commit in commits[offset:])
+
+    def branches(self):
+        lines = []
+        if self.repo.head.is_detached:
+            lines.append(f"* (HEAD detached at {self.repo.head.commit.hexsha[:7]})")
+            active = None
+        else:
+            active = self.repo.active_branch.name
+        for head in self.repo.heads:
+            lines.append(f"{'*' if head.name == active else ' '} {head.name}")
+        return '\n'.join(lines)
+
+    def close(self):
+        self.repo.close()
+
+
+def subject(message):
+    lines = []
+    for line in message.splitlines():
+        if line.strip():
+            lines.append(line.rstrip())
+        elif lines:
+            break
+    return ' '.join(lines)
+
+
+def format_commit(commit):
+    date = commit.authored_datetime
+    return (f"Commit: {commit.hexsha}\nAuthor: {commit.author.name} <{commit.author.email}>\n"
+            f"Date: {date:%a %b} {date.day} {date:%H:%M:%S %Y %z}\nMessage: {subject(commit.message)}\n")
+
+
+git_helpers = HelperPool(GitHelper, git_pool_size, git_pool_idle_timeout, 'git helpers')
@@ -1,7 +1,12 @@
 import os
 import subprocess
+import time
 
-import git
+from config.config import git_pool_log_limit, prefetch_fresh
+from modules import commit_index, process
+from modules.commit_index import Commit, FIELD_SEPARATOR
+from modules.git_pool import git_helpers
+from modules.status_cache import status_cache
 from modules.vcs import VCSInterface
 
 
@@ -16,12 +21,20 @@ class GIT(VCSInterface):
 
     def run_command(self, command, repo_path):
         try:
-            result = subprocess.run(command, cwd=repo_path, capture_output=True, text=True, check=True)
+            result = process.run(command, cwd=repo_path)
             return result.stdout.strip()
         except subprocess.CalledProcessError as e:
             error_message = f"Error executing '{' '.join(e.cmd)}' command: {e.stderr}\n"
             self.client_socket.sendall(error_message.encode('utf-8'))
 
+    def stream_command(self, command, repo_path):
+        try:
+            for chunk in process.stream(command, cwd=repo_path):
+                self.client_socket.sendall(chunk)
+        except subprocess.CalledProcessError as e:
+            error_message = f"Error executing '{' '.join(e.cmd)}' command: {e.stderr}\n"
+            self.client_socket.sendall(error_message.encode('utf-8'))
+
     def add(self, repo_path, files):
         try:
             if files is None:
@@ -53,7 +66,10 @@ class GIT(VCSInterface):
             if repo_path is None:
                 repo_path = '..'
 
-            command = ['git', 'pull']
+            if self.prefetched(repo_path):
+                command = ['git', 'merge', '--no-edit', '@{upstream}']
+            else:
+                command = ['git', 'pull']
             self.run_command(command, repo_path)
             message = "Git: Code updated successfully."
             self.client_socket.sendall(message.encode('utf-8'))
@@ -90,28 +106,130 @@ class GIT(VCSInterface):
         except Exception as e:
             self.client_socket.sendall(f"Error executing 'init_repo' command: {str(e)}\n".encode('utf-8'))
 
-    def log(self, repo_path):
+    def log(self, repo_path, limit=None, offset=None, since=None, until=None, path=None):
         try:
+            if since is None and until is None and path is None and limit is not None and \
+                    limit + (offset or 0) <= git_pool_log_limit and self.log_from_helper(repo_path, limit, offset or 0):
+                return
             command = ['git', 'log', '--pretty=format:Commit: %H%nAuthor: %an <%ae>%nDate: %ad%nMessage: %s%n']
-            log_output = self.run_command(command, repo_path)
-            self.client_socket.sendall(log_output.encode('utf-8'))
+            if limit is not None:
+                command.append(f'--max-count={limit}')
+            if offset is not None:
+                command.append(f'--skip={offset}')
+            if since is not None:
+                command.append(f'--since={since}')
+            if until is not None:
+                command.append(f'--until={until}')
+            if path is not None:
+                command += ['--', path]
+            self.stream_command(command, repo_path)
         except Exception as e:
             self.client_socket.sendall(f"Error executing 'log' command: {str(e)}\n".encode('utf-8'))
 
+    def log_from_helper(self, repo_path, limit, offset):
+        try:
+            with git_helpers.acquire(repo_path) as helper:
+                output = helper.log(limit, offset)
+        except ValueError:
+            return False
+        git_helpers.record_saved_spawn()
+        self.client_socket.sendall(output.encode('utf-8'))
+        return True
+
+    def history_head(self, repo_path):
+        with git_helpers.acquire(repo_path) as helper:
+            revision = helper.head_revision()
+        git_helpers.record_saved_spawn()
+        return revision
+
+    def cache_revision(self, repo_path):
+        return self.history_head(repo_path)
+
+    def iter_commits(self, repo_path, since_revision=None):
+        command = ['git', '-c', 'core.quotePath=false', 'log', '--reverse', '--name-only',
+                   '--format=%x1e%H%x1f%an <%ae>%x1f%ct%x1f%B%x1f']
+        if since_revision is not None:
+            process.run(['git', 'merge-base', '--is-ancestor', since_revision, 'HEAD'], cwd=repo_path)
+            command.append(f'{since_revision}..HEAD')
+        for record in commit_index.iter_records(process.stream(command, cwd=repo_path)):
+            revision, author, timestamp, message, paths = record.split(FIELD_SEPARATOR)
+            yield Commit(revision, author, commit_index.format_timestamp(int(timestamp)), message.strip(),
+                         paths.strip().splitlines())
+
+    def prefetch(self, repo_path):
+        process.run(['git', 'fetch', '--quiet', '--prune'], cwd=repo_path)
+
+    def prefetched(self, repo_path):
+        last_fetch = self.database.last_prefetch(os.path.abspath(repo_path))
+        if last_fetch is None or time.time() - last_fetch >= prefetch_fresh:
+            return False
+        try:
+            process.run(['git', 'rev-parse', '--verify', '--quiet', '@{upstream}'], cwd=repo_path)
+            return True
+        except subprocess.CalledProcessError:
+            return False
+
+    def history_state(self, repo_path):
+        output = process.run(['git', 'for-each-ref', '--format=%(refname) %(objectname)', 'refs/heads', 'refs/tags'],
+                             cwd=repo_path).stdout
+        try:
+            head = process.run(['git', 'symbolic-ref', '-q', 'HEAD'], cwd=repo_path).stdout.strip()
+        except subprocess.CalledProcessError:
+            head = None
+        return {'refs': dict(line.split(' ', 1) for line in output.splitlines()), 'head': head}
+
+    def create_bundle(self, repo_path, previous_state, state, output_path):
+        previous_refs = previous_state['refs'] if previous_state is not None else {}
+        changed = sorted(ref for ref, revision in state['refs'].items() if previous_refs.get(ref) != revision)
+        if not changed:
+            return None
+        excluded = []
+        for revision in sorted(set(previous_refs.values())):
+            try:
+                process.run(['git', 'cat-file', '-e', revision], cwd=repo_path)
+                excluded.append(f'^{revision}')
+            except subprocess.CalledProcessError:
+                continue
+        count = process.run(['git', 'rev-list', '--count', '--objects'] + changed + excluded, cwd=repo_path)
+        if int(count.stdout.strip() or 0) == 0:
+            return None
+        process.run(['git', 'bundle', 'create', '-q', os.path.abspath(output_path)] + changed + excluded,
+                    cwd=repo_path)
+        return 'incremental' if previous_state is not None else 'full'
+
+    def restore_bundles(self, bundle_paths, state, target):
+        process.run(['git', 'init', '-q', target])
+        for bundle_path in bundle_paths:
+            process.run(['git', 'fetch', '-q', '--update-head-ok', os.path.abspath(bundle_path), '+refs/*:refs/*'],
+                        cwd=target)
+        restored = process.run(['git', 'for-each-ref', '--format=%(refname)'], cwd=target).stdout.split()
+        for ref in restored:
+            if ref not in state['refs']:
+                process.run(['git', 'update-ref', '-d', ref], cwd=target)
+        for ref, revision in state['refs'].items():
+            process.run(['git', 'update-ref', ref, revision], cwd=target)
+        if state['head'] is not None and state['head'] in state['refs']:
+            process.run(['git', 'symbolic-ref', 'HEAD', state['head']], cwd=target)
+            process.run(['git', 'reset', '-q', '--hard'], cwd=target)
+
     def status(self, repo_path):
         if repo_path is None:
             repo_path = '..'
-        os.chdir(repo_path)
-        repo = git.Repo(repo_path)
-        status_result = repo.git.status()
+        status_result = status_cache.get(repo_path, self.vcs_type, lambda: self.read_status(repo_path))
         self.client_socket.sendall(status_result.encode('utf-8'))
 
+    def read_status(self, repo_path):
+        return process.run(['git', 'status'], cwd=repo_path).stdout.strip()
+
     def pull(self, repo_path):
         try:
             if repo_path is None:
                 repo_path = '..'
 
-            command = ['git', 'pull']
+            if self.prefetched(repo_path):
+                command = ['git', 'merge', '--no-edit', '@{upstream}']
+            else:
+                command = ['git', 'pull']
             self.run_command(command, repo_path)
             message = "Git: Changes pulled successfully."
             self.client_socket.sendall(message.encode('utf-8'))
@@ -132,8 +250,9 @@ class GIT(VCSInterface):
 
     def list(self, repo_path):
         try:
-            command = ['git', 'branch']
-            branches_output = self.run_command(command, repo_path)
+            with git_helpers.acquire(repo_path) as helper:
+                branches_output = helper.branches()
+            git_helpers.record_saved_spawn()
             message = f"Git Branches: {branches_output}"
             self.client_socket.sendall(message.encode('utf-8'))
         except Exception as e:
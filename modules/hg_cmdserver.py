@@ -0,0 +1,153 @@
+import logging
+import os
+import struct
+import subprocess
+import threading
+import time
+
+from config.config import hg_cmdserver, hg_pool_size, hg_pool_idle_timeout, hg_cmdserver_retry
+from modules import process
+from modules.pool import HelperPool
+
+CHANNEL_HEADER = struct.Struct('>cI')
+RESULT = struct.Struct('>i')
+INPUT_CHANNELS = (b'I', b'L')
+
+
+class CommandServerUnavailable(Exception):
+    pass
+
+
+class CommandServer:
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        env = dict(os.environ, HGPLAIN='1', HGENCODING='UTF-8')
+        try:
+            self.popen = subprocess.Popen(['hg', 'serve', '--cmdserver', 'pipe', '--config', 'ui.interactive=False'],
+                                          cwd=repo_path, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                          stderr=subprocess.DEVNULL, env=env)
+        except OSError as e:
+            raise CommandServerUnavailable(f"Cannot start hg command server: {e}")
+        try:
+            channel, hello = self.read_channel()
+        except EOFError:
+            self.close()
+            raise CommandServerUnavailable("hg command server exited before greeting")
+        if channel != b'o' or b'runcommand' not in hello:
+            self.close()
+            raise CommandServerUnavailable("hg command server does not support runcommand")
+
+    def alive(self):
+        return self.popen.poll() is None
+
+    def read_exact(self, size):
+        data = self.popen.stdout.read(size)
+        if len(data) < size:
+            raise EOFError("hg command server closed its pipe")
+        return data
+
+    def read_channel(self):
+        channel, length = CHANNEL_HEADER.unpack(self.read_exact(CHANNEL_HEADER.size))
+        if channel in INPUT_CHANNELS:
+            return channel, length
+        return channel, self.read_exact(length)
+
+    def runcommand(self, command):
+        with process.tracked(command):
+            yield from self.exchange(command)
+
+    def exchange(self, command):
+        blob = b'\0'.join(arg.encode('utf-8') for arg in command[1:])
+        self.popen.stdin.write(b'runcommand\n' + struct.pack('>I', len(blob)) + blob)
+        self.popen.stdin.flush()
+        while True:
+            channel, data = self.read_channel()
+            if channel in INPUT_CHANNELS:
+                self.popen.stdin.write(struct.pack('>I', 0))
+                self.popen.stdin.flush()
+            elif channel == b'r':
+                yield channel, RESULT.unpack(data)[0]
+                return
+            elif channel.isupper():
+                raise EOFError(f"hg command server requested unsupported channel {channel!r}")
+            else:
+                yield channel, data
+
+    def stream(self, command, stderr):
+        timeout = process.remaining(command)
+        timer = process.start_timer(timeout, self.popen.kill)
+        finished = False
+        try:
+            for channel, data in self.runcommand(command):
+                if channel == b'o':
+                    yield data
+                elif channel == b'e':
+                    stderr.append(data)
+                elif channel == b'r':
+                    finished = True
+                    if data != 0:
+                        raise subprocess.CalledProcessError(data, command, None,
+                                                            b''.join(stderr).decode('utf-8', errors='replace'))
+        except (EOFError, OSError) as e:
+            process.check_timeout(timer, command, timeout)
+            raise subprocess.CalledProcessError(-1, command, None, f"hg command server failed: {e}")
+        finally:
+            process.stop_timer(timer)
+            if not finished:
+                self.close()
+
+    def run(self, command):
+        stderr = []
+        stdout = b''.join(self.stream(command, stderr)).decode('utf-8', errors='replace')
+        return subprocess.CompletedProcess(command, 0, stdout, b''.join(stderr).decode('utf-8', errors='replace'))
+
+    def close(self):
+        if self.popen.poll() is None:
+            try:
+                self.popen.stdin.close()
+                self.popen.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.popen.kill()
+                self.popen.wait()
+        self.popen.stdout.close()
+
+
+hg_servers = HelperPool(CommandServer, hg_pool_size, hg_pool_idle_timeout, 'hg command servers')
+unavailable_until = {}
+
+
+def available(repo_path):
+    if not hg_cmdserver or repo_path is None or not os.path.isdir(os.path.join(repo_path, '.hg')):
+        return False
+    return unavailable_until.get(os.path.abspath(repo_path), 0) <= time.monotonic()
+
+
+def mark_unavailable(repo_path, error):
+    logging.warning(f"Falling back to hg subprocesses for {repo_path}: {error}")
+    unavailable_until[os.path.abspath(repo_path)] = time.monotonic() + hg_cmdserver_retry
+
+
+def run(command, repo_path):
+    if available(repo_path):
+        try:
+            with hg_servers.acquire(repo_path) as server:
+                result = server.run(command)
+            hg_servers.record_saved_spawn()
+            return result
+        except CommandServerUnavailable as e:
+            mark_unavailable(repo_path, e)
+    return process.run(command, cwd=repo_path)
+
+
+def stream(command, repo_path):
+    if available(repo_path):
+        try:
+            with hg_servers.acquire(repo_path) as server:
+                yield from server.stream(command, [])
+            hg_servers.record_saved_spawn()
+            return
+        except CommandServerUnavailable as e:
+            mark_unavailable(repo_path, e)
+    yield from process.stream(command, cwd=repo_path)
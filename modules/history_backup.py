@@ -0,0 +1,112 @@
+import json
+import os
+import subprocess
+from collections import namedtuple
+
+from config.config import backup_directory, history_full_every, history_chains
+from modules.backup import backup_name
+
+HistorySnapshot = namedtuple('HistorySnapshot',
+                             ['sequence', 'repo_path', 'vcs_type', 'kind', 'state', 'path', 'size', 'created_at'])
+
+BUNDLE_EXTENSIONS = {'git': 'bundle', 'mercurial': 'hg', 'svn': 'dump'}
+
+
+def snapshots(database, name):
+    return [HistorySnapshot(*row) for row in database.fetch_history_snapshots(name)]
+
+
+def create(vcs, repo_path, root=backup_directory):
+    repo_path = os.path.abspath(repo_path)
+    name = backup_name(repo_path)
+    history = snapshots(vcs.database, name)
+    previous = history[-1] if history else None
+    state = vcs.history_state(repo_path)
+    if previous is not None and json.loads(previous.state) == state:
+        return None
+
+    full_positions = [position for position, snapshot in enumerate(history) if snapshot.kind == 'full']
+    increments = len(history) - full_positions[-1] if full_positions else len(history)
+    previous_state = None
+    if previous is not None and previous.vcs_type == vcs.vcs_type and increments < history_full_every:
+        previous_state = json.loads(previous.state)
+
+    sequence = previous.sequence + 1 if previous is not None else 1
+    directory = os.path.join(root, 'history', name)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{sequence:06d}.{BUNDLE_EXTENSIONS[vcs.vcs_type]}")
+    try:
+        kind = vcs.create_bundle(repo_path, previous_state, state, path)
+    except subprocess.CalledProcessError:
+        if previous_state is None:
+            raise
+        kind = vcs.create_bundle(repo_path, None, state, path)
+    if kind is None:
+        kind = 'full' if previous_state is None else 'incremental'
+        path = None
+
+    size = os.path.getsize(path) if path is not None else 0
+    vcs.database.insert_history_snapshot(name, sequence, repo_path, vcs.vcs_type, kind, json.dumps(state), path, size)
+    if kind == 'full':
+        prune(vcs.database, name)
+    return HistorySnapshot(sequence, repo_path, vcs.vcs_type, kind, json.dumps(state), path, size, None)
+
+
+def prune(database, name):
+    history = snapshots(database, name)
+    fulls = [snapshot.sequence for snapshot in history if snapshot.kind == 'full']
+    if len(fulls) <= history_chains:
+        return
+    oldest = fulls[-history_chains]
+    for snapshot in history:
+        if snapshot.sequence < oldest and snapshot.path is not None and os.path.exists(snapshot.path):
+            os.remove(snapshot.path)
+    database.remove_history_snapshots(name, oldest)
+
+
+def chain(database, name, sequence=None):
+    history = snapshots(database, name)
+    if sequence is not None:
+        history = [snapshot for snapshot in history if snapshot.sequence <= sequence]
+    if not history:
+        return []
+    start = max((position for position, snapshot in enumerate(history) if snapshot.kind == 'full'), default=0)
+    return history[start:]
+
+
+def restore(vcs, name, sequence, target):
+    snapshot_chain = chain(vcs.database, name, sequence)
+    if not snapshot_chain:
+        return []
+    if snapshot_chain[-1].vcs_type != vcs.vcs_type:
+        raise ValueError(f"History backup '{name}' was taken from a {snapshot_chain[-1].vcs_type} repository")
+    vcs.restore_bundles([snapshot.path for snapshot in snapshot_chain if snapshot.path is not None],
+                        json.loads(snapshot_chain[-1].state), target)
+    return snapshot_chain
+
+
+def backup(vcs, repo_path):
+    try:
+        snapshot = create(vcs, repo_path)
+    except subprocess.CalledProcessError as e:
+        vcs.client_socket.sendall(f"Error executing '{' '.join(e.cmd)}' command: {e.stderr}\n".encode('utf-8'))
+        return
+    if snapshot is None:
+        vcs.client_socket.sendall(b"History backup is up to date.\n")
+        return
+    vcs.client_socket.sendall(f"History backup completed successfully. Snapshot "
+                              f"{backup_name(snapshot.repo_path)}@{snapshot.sequence} ({snapshot.kind}, "
+                              f"{snapshot.size} bytes).".encode('utf-8'))
+
+
+def load(vcs, name, sequence, target):
+    try:
+        snapshot_chain = restore(vcs, name, sequence, target)
+    except subprocess.CalledProcessError as e:
+        vcs.client_socket.sendall(f"Error executing '{' '.join(e.cmd)}' command: {e.stderr}\n".encode('utf-8'))
+        return
+    if not snapshot_chain:
+        vcs.client_socket.sendall(f"History backup '{name}' not found on the server.\n".encode('utf-8'))
+        return
+    vcs.client_socket.sendall(f"History backup loaded successfully. Applied {len(snapshot_chain)} snapshots "
+                              f"up to {name}@{snapshot_chain[-1].sequence}.".encode('utf-8'))
@@ -1,19 +1,30 @@
+from collections import deque
+from config.config import command_queue_size
+from modules.batch import split_batch
+
+
 class CommandIterator:
-    def __init__(self, client_socket):
+    def __init__(self, client_socket, max_size=command_queue_size):
         self.client_socket = client_socket
-        self.commands = []
-        self.index = 0
+        self.commands = deque()
+        self.max_size = max_size
 
     def add_command(self, command):
-        self.commands.append(command)
+        self.add_commands([command])
+
+    def add_batch(self, message):
+        self.add_commands(split_batch(message))
+
+    def add_commands(self, commands):
+        if len(self.commands) + len(commands) > self.max_size:
+            raise OverflowError(f"Command queue is limited to {self.max_size} commands")
+        self.commands.extend(commands)
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        if self.index < len(self.commands):
-            command = self.commands[self.index]
-            self.index += 1
-            return command
+        if self.commands:
+            return self.commands.popleft()
         else:
             raise StopIteration
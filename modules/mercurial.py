@@ -1,5 +1,10 @@
 import os
 import subprocess
+import time
+from config.config import prefetch_fresh
+from modules import commit_index, hg_cmdserver, process
+from modules.commit_index import Commit, FIELD_SEPARATOR
+from modules.status_cache import status_cache
 from modules.vcs import VCSInterface
 
 
@@ -14,12 +19,20 @@ class Mercurial(VCSInterface):
 
     def run_command(self, command, repo_path):
         try:
-            result = subprocess.run(command, cwd=repo_path, capture_output=True, text=True, check=True)
+            result = hg_cmdserver.run(command, repo_path)
             return result.stdout.strip()
         except subprocess.CalledProcessError as e:
             error_message = f"Error executing '{' '.join(e.cmd)}' command: {e.stderr}\n"
             self.client_socket.sendall(error_message.encode('utf-8'))
 
+    def stream_command(self, command, repo_path):
+        try:
+            for chunk in hg_cmdserver.stream(command, repo_path):
+                self.client_socket.sendall(chunk)
+        except subprocess.CalledProcessError as e:
+            error_message = f"Error executing '{' '.join(e.cmd)}' command: {e.stderr}\n"
+            self.client_socket.sendall(error_message.encode('utf-8'))
+
     def add(self, repo_path, files):
         try:
             if files is None:
@@ -63,8 +76,9 @@ class Mercurial(VCSInterface):
             if status_result:
                 message = "Mercurial: Local changes exist. Cannot update."
             else:
-                command_pull = ['hg', 'pull']
-                self.run_command(command_pull, repo_path)
+                if not self.prefetched(repo_path):
+                    command_pull = ['hg', 'pull']
+                    self.run_command(command_pull, repo_path)
                 message = "Mercurial: Code updated successfully."
 
             self.client_socket.sendall(message.encode('utf-8'))
@@ -89,10 +103,11 @@ class Mercurial(VCSInterface):
 
     def init_repo(self, repository_name, repo_path):
         try:
-            if not os.path.exists('.hg'):
+            if not os.path.exists(os.path.join(repo_path, '.hg')):
                 command_init = ['hg', 'init']
                 self.run_command(command_init, repo_path)
                 message = "Mercurial: Repository initialized successfully."
+                self.database.insert_repository(repository_name, "Mercurial", repo_path)
             else:
                 message = "Mercurial: Repository already exists."
 
@@ -100,27 +115,95 @@ class Mercurial(VCSInterface):
         except Exception as e:
             self.client_socket.sendall(f"Error executing 'init' command: {str(e)}\n".encode('utf-8'))
 
-    def log(self, repo_path):
+    def log(self, repo_path, limit=None, offset=None, since=None, until=None, path=None):
         try:
             command_log = ['hg', 'log', '--template',
                            'Changeset: {node|short}\nAuthor: {author} <{email}>\nDate: {date|shortdate}\nMessage: {desc}\n']
-            log_output = self.run_command(command_log, repo_path)
-            self.client_socket.sendall(log_output.encode('utf-8'))
+            revset = self.log_revset(limit, offset, since, until, path)
+            if revset is not None:
+                command_log += ['-r', revset]
+            self.stream_command(command_log, repo_path)
         except Exception as e:
             self.client_socket.sendall(f"Error executing 'log' command: {str(e)}\n".encode('utf-8'))
 
+    def log_revset(self, limit, offset, since, until, path):
+        conditions = []
+        if since is not None:
+            conditions.append(f"date('>{revset_quote(since)}')")
+        if until is not None:
+            conditions.append(f"date('<{revset_quote(until)}')")
+        if path is not None:
+            conditions.append(f"file('path:{revset_quote(path)}')")
+        if not conditions and limit is None and offset is None:
+            return None
+
+        revset = f"reverse({' and '.join(conditions) or 'all()'})"
+        if limit is not None or offset is not None:
+            count = limit if limit is not None else 2 ** 31 - 1
+            revset = f"limit({revset}, {count}, {offset or 0})"
+        return revset
+
+    def history_head(self, repo_path):
+        return hg_cmdserver.run(['hg', 'log', '-r', '.', '--template', '{node}'], repo_path).stdout.strip()
+
+    def cache_revision(self, repo_path):
+        return self.history_head(repo_path)
+
+    def iter_commits(self, repo_path, since_revision=None):
+        revset = f"sort(only(., {since_revision}), rev)" if since_revision is not None else "sort(::., rev)"
+        template = '\x1e{node}\x1f{author}\x1f{date|hgdate}\x1f{desc}\x1f{join(files, "\\n")}'
+        command = ['hg', 'log', '-r', revset, '--template', template]
+        for record in commit_index.iter_records(hg_cmdserver.stream(command, repo_path)):
+            revision, author, date, message, paths = record.split(FIELD_SEPARATOR)
+            yield Commit(revision, author, commit_index.format_timestamp(int(date.split()[0])), message.strip(),
+                         paths.splitlines())
+
+    def prefetch(self, repo_path):
+        process.run(['hg', 'pull', '--quiet'], cwd=repo_path)
+
+    def prefetched(self, repo_path):
+        last_fetch = self.database.last_prefetch(os.path.abspath(repo_path))
+        return last_fetch is not None and time.time() - last_fetch < prefetch_fresh
+
+    def history_state(self, repo_path):
+        output = hg_cmdserver.run(['hg', 'log', '-r', 'heads(all())', '--template', '{node}\n'], repo_path).stdout
+        return {'heads': sorted(output.split())}
+
+    def create_bundle(self, repo_path, previous_state, state, output_path):
+        command = ['hg', 'bundle', '--type', 'bzip2-v2', '--quiet']
+        if previous_state is not None and previous_state['heads']:
+            for head in previous_state['heads']:
+                command += ['--base', head]
+        else:
+            command.append('--all')
+        try:
+            process.run(command + [os.path.abspath(output_path)], cwd=repo_path)
+        except subprocess.CalledProcessError as e:
+            if e.returncode == 1:
+                return None
+            raise
+        return 'incremental' if previous_state is not None else 'full'
+
+    def restore_bundles(self, bundle_paths, state, target):
+        process.run(['hg', 'init', target])
+        for bundle_path in bundle_paths:
+            process.run(['hg', 'unbundle', '--quiet', os.path.abspath(bundle_path)], cwd=target)
+        process.run(['hg', 'update', '--quiet'], cwd=target)
+
     def status(self, repo_path):
         try:
             command_status = ['hg', 'status']
-            status_result = self.run_command(command_status, repo_path)
+            status_result = status_cache.get(repo_path, self.vcs_type,
+                                             lambda: self.run_command(command_status, repo_path))
             self.client_socket.sendall(status_result.encode('utf-8'))
         except Exception as e:
             self.client_socket.sendall(f"Error executing 'status' command: {str(e)}\n".encode('utf-8'))
 
     def pull(self, repo_path):
         try:
-            command_pull = ['hg', 'pull']
-            self.run_command(command_pull, repo_path)
+            if not self.prefetched(repo_path):
+                command_pull = ['hg', 'pull']
+                self.run_command(command_pull, repo_path)
             message = "Mercurial: Pull operation completed successfully."
             self.client_socket.sendall(message.encode('utf-8'))
         except Exception as e:
@@ -183,3 +266,7 @@ class Mercurial(VCSInterface):
             self.client_socket.sendall(message.encode('utf-8'))
         except Exception as e:
             self.client_socket.sendall(f"Error executing 'tag' command: {str(e)}\n".encode('utf-8'))
+
+
+def revset_quote(value):
+    return value.replace('\\', '\\\\').replace("'", "\\'")
@@ -0,0 +1,240 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from config.config import metrics_buckets, metrics_interval, metrics_file, metrics_top_repositories
+
+HISTOGRAMS = (
+    ('latency_seconds', 'Total command latency'),
+    ('subprocess_seconds', 'Wall time spent in VCS subprocesses'),
+    ('subprocess_cpu_seconds', 'CPU time of VCS subprocesses'),
+    ('bytes_sent', 'Response bytes sent to the client'),
+    ('queue_wait_seconds', 'Time spent waiting for a worker thread'),
+    ('lock_wait_seconds', 'Time spent waiting for the repository lock'),
+)
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_local = threading.local()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class SubprocessUsage:
+    def __init__(self):
+        self.cpu_seconds = None
+
+
+class CommandSample:
+    def __init__(self):
+        self.subprocess_seconds = 0.0
+        self.subprocess_cpu_seconds = 0.0
+        self.bytes_sent = 0
+        self.lock_wait_seconds = 0.0
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.repositories = {}
+        self.compression = {}
+        self.sources = {}
+        self.started = time.time()
+
+    def histogram(self, name, command, backend):
+        key = (name, command, backend)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = Histogram(BYTE_BUCKETS if name == 'bytes_sent' else metrics_buckets)
+            self.histograms[key] = histogram
+        return histogram
+
+    @contextmanager
+    def command(self, command, backend, repo_path=None):
+        sample = CommandSample()
+        previous = getattr(_local, 'sample', None)
+        queue_wait = getattr(_local, 'queue_wait', 0.0)
+        _local.sample = sample
+        _local.queue_wait = 0.0
+        started = time.monotonic()
+        try:
+            yield sample
+        finally:
+            elapsed = time.monotonic() - started
+            _local.sample = previous
+            with self.lock:
+                self.histogram('latency_seconds', command, backend).observe(elapsed)
+                self.histogram('subprocess_seconds', command, backend).observe(sample.subprocess_seconds)
+                if sample.subprocess_cpu_seconds is not None:
+                    self.histogram('subprocess_cpu_seconds', command, backend).observe(sample.subprocess_cpu_seconds)
+                self.histogram('bytes_sent', command, backend).observe(sample.bytes_sent)
+                self.histogram('queue_wait_seconds', command, backend).observe(queue_wait)
+                self.histogram('lock_wait_seconds', command, backend).observe(sample.lock_wait_seconds)
+                if repo_path is not None:
+                    count, total = self.repositories.get((repo_path, backend), (0, 0.0))
+                    self.repositories[(repo_path, backend)] = (count + 1, total + elapsed)
+
+    @contextmanager
+    def subprocess(self):
+        sample = getattr(_local, 'sample', None)
+        usage = SubprocessUsage()
+        started = time.monotonic()
+        try:
+            yield usage
+        finally:
+            if sample is not None:
+                sample.subprocess_seconds += time.monotonic() - started
+                if usage.cpu_seconds is None or sample.subprocess_cpu_seconds is None:
+                    sample.subprocess_cpu_seconds = None
+                else:
+                    sample.subprocess_cpu_seconds += usage.cpu_seconds
+
+    def bytes_sent(self, size):
+        sample = getattr(_local, 'sample', None)
+        if sample is not None:
+            sample.bytes_sent += size
+
+    def compressed(self, algorithm, raw, compressed, cpu_seconds):
+        with self.lock:
+            total_raw, total_compressed, total_cpu = self.compression.get(algorithm, (0, 0, 0.0))
+            self.compression[algorithm] = (total_raw + raw, total_compressed + compressed, total_cpu + cpu_seconds)
+
+    def enqueued(self, func):
+        submitted = time.monotonic()
+
+        def run(*args, **kwargs):
+            _local.queue_wait = time.monotonic() - submitted
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _local.queue_wait = 0.0
+        return run
+
+    def register_source(self, name, stats):
+        self.sources[name] = stats
+
+    def snapshot(self):
+        with self.lock:
+            histograms = {key: (histogram.count, histogram.total, histogram.max, histogram.quantile(0.5),
+                                histogram.quantile(0.95), list(histogram.counts), histogram.buckets)
+                          for key, histogram in self.histograms.items()}
+            repositories = dict(self.repositories)
+            compression = dict(self.compression)
+        return histograms, repositories, compression
+
+    def render_text(self):
+        histograms, repositories, compression = self.snapshot()
+        lines = [f"Metrics since {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started))}"]
+        commands = sorted({(command, backend) for _, command, backend in histograms},
+                          key=lambda key: -histograms[('latency_seconds',) + key][1])
+        if not commands:
+            lines.append("No commands recorded yet.")
+        else:
+            lines.append(f"{'command':<12} {'backend':<10} {'count':>6} {'p50':>8} {'p95':>8} {'max':>8} "
+                         f"{'subproc':>8} {'cpu':>8} {'queue':>8} {'lock':>8} {'bytes':>8}")
+        for command, backend in commands:
+            count, total, maximum, p50, p95, _, _ = histograms[('latency_seconds', command, backend)]
+            subprocess_total = histograms[('subprocess_seconds', command, backend)][1]
+            cpu_count, cpu_total = histograms.get(('subprocess_cpu_seconds', command, backend), (0, 0.0))[:2]
+            queue_total = histograms[('queue_wait_seconds', command, backend)][1]
+            lock_total = histograms[('lock_wait_seconds', command, backend)][1]
+            bytes_total = histograms[('bytes_sent', command, backend)][1]
+            lines.append(f"{command:<12} {backend:<10} {count:>6} {p50:>7.3f}s {p95:>7.3f}s {maximum:>7.3f}s "
+                         f"{subprocess_total / count:>7.3f}s "
+                         f"{f'{cpu_total / cpu_count:.3f}s' if cpu_count else '-':>8} "
+                         f"{queue_total / count:>7.3f}s {lock_total / count:>7.3f}s {int(bytes_total / count):>8}")
+        if repositories:
+            lines.append("Hottest repositories:")
+            hottest = sorted(repositories.items(), key=lambda item: -item[1][1])[:metrics_top_repositories]
+            for (repo_path, backend), (count, total) in hottest:
+                lines.append(f"  {repo_path} ({backend}): {count} commands, {total:.3f}s total")
+        for algorithm, (raw, compressed, cpu_seconds) in sorted(compression.items()):
+            ratio = raw / compressed if compressed else 0.0
+            lines.append(f"{algorithm} compression: {raw} -> {compressed} bytes (ratio {ratio:.1f}x), "
+                         f"{cpu_seconds:.3f}s CPU")
+        for name, stats in sorted(self.sources.items()):
+            lines.append(f"{name}: " + ', '.join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+                                                   for key, value in stats().items()))
+        return '\n'.join(lines) + '\n'
+
+    def render_prometheus(self):
+        histograms, repositories, compression = self.snapshot()
+        lines = []
+        for name, description in HISTOGRAMS:
+            metric = f"vcs_command_{name}"
+            lines.append(f"# HELP {metric} {description}.")
+            lines.append(f"# TYPE {metric} histogram")
+            for (histogram_name, command, backend), (count, total, _, _, _, counts, buckets) in sorted(histograms.items()):
+                if histogram_name != name:
+                    continue
+                labels = f'command="{command}",backend="{backend}"'
+                cumulative = 0
+                for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+                    cumulative += bucket_count
+                    lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{metric}_sum{{{labels}}} {total}")
+                lines.append(f"{metric}_count{{{labels}}} {count}")
+        lines.append("# TYPE vcs_repository_commands_total counter")
+        for (repo_path, backend), (count, total) in sorted(repositories.items()):
+            lines.append(f'vcs_repository_commands_total{{repository="{repo_path}",backend="{backend}"}} {count}')
+        lines.append("# TYPE vcs_compression_input_bytes_total counter")
+        lines.append("# TYPE vcs_compression_output_bytes_total counter")
+        lines.append("# TYPE vcs_compression_cpu_seconds_total counter")
+        for algorithm, (raw, compressed, cpu_seconds) in sorted(compression.items()):
+            lines.append(f'vcs_compression_input_bytes_total{{algorithm="{algorithm}"}} {raw}')
+            lines.append(f'vcs_compression_output_bytes_total{{algorithm="{algorithm}"}} {compressed}')
+            lines.append(f'vcs_compression_cpu_seconds_total{{algorithm="{algorithm}"}} {cpu_seconds}')
+        for name, stats in sorted(self.sources.items()):
+            prefix = 'vcs_' + name.replace(' ', '_')
+            for key, value in stats().items():
+                lines.append(f"{prefix}_{key} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def dump(self):
+        logging.info(self.render_text())
+        if metrics_file:
+            temporary = f"{metrics_file}.tmp"
+            with open(temporary, 'w') as output:
+                output.write(self.render_prometheus())
+            os.replace(temporary, metrics_file)
+
+    def run_reporter(self, interval=metrics_interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.dump()
+            except OSError as e:
+                logging.error(f"Could not write metrics: {e}")
+
+    def start_reporter(self):
+        if metrics_interval:
+            threading.Thread(target=self.run_reporter, name='metrics-reporter', daemon=True).start()
+
+
+metrics = Metrics()
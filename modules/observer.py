@@ -0,0 +1,31 @@
+import threading
+
+
+class RepositoryObserver:
+    def repository_changed(self, repo_path):
+        raise NotImplementedError
+
+
+class RepositorySubject:
+    def __init__(self):
+        self.observers = []
+        self.lock = threading.Lock()
+
+    def attach(self, observer):
+        with self.lock:
+            if observer not in self.observers:
+                self.observers.append(observer)
+
+    def detach(self, observer):
+        with self.lock:
+            if observer in self.observers:
+                self.observers.remove(observer)
+
+    def notify(self, repo_path):
+        with self.lock:
+            observers = list(self.observers)
+        for observer in observers:
+            observer.repository_changed(repo_path)
+
+
+repository_events = RepositorySubject()
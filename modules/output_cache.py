@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from config.config import output_cache_bytes, output_cache_entry_bytes, output_cache_ttl
+from modules.metrics import metrics
+from modules.observer import RepositoryObserver, repository_events
+
+
+class TeeSocket:
+    def __init__(self, client_socket, limit):
+        self.client_socket = client_socket
+        self.limit = limit
+        self.chunks = []
+        self.size = 0
+        self.failed = False
+
+    def sendall(self, data):
+        if bytes(data[:16]).lstrip().startswith((b'Error', b'Invalid')):
+            self.failed = True
+        if self.chunks is not None:
+            self.size += len(data)
+            if self.size > self.limit:
+                self.chunks = None
+            else:
+                self.chunks.append(bytes(data))
+        self.client_socket.sendall(data)
+
+    def getvalue(self):
+        if self.failed or self.chunks is None:
+            return None
+        return b''.join(self.chunks)
+
+    def __getattr__(self, name):
+        return getattr(self.client_socket, name)
+
+
+class OutputCache(RepositoryObserver):
+    def __init__(self, max_bytes=output_cache_bytes, max_entry_bytes=output_cache_entry_bytes, ttl=output_cache_ttl):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def lookup(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                self.remove(key)
+            self.misses += 1
+            return None
+
+    def store(self, key, output, generation):
+        if output is None or len(output) > self.max_entry_bytes:
+            return
+        with self.lock:
+            if self.generations.get(key[0], 0) != generation:
+                return
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = (output, time.monotonic() + self.ttl)
+            self.size += len(output)
+            while self.size > self.max_bytes and self.entries:
+                self.remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def remove(self, key):
+        output, _ = self.entries.pop(key)
+        self.size -= len(output)
+
+    def get(self, client_socket, repo_path, vcs_type, revision, command, arguments, produce):
+        root = os.path.abspath(repo_path)
+        key = (root, vcs_type, revision, command, tuple(sorted(arguments.items())))
+        output = self.lookup(key)
+        if output is not None:
+            client_socket.sendall(output)
+            return
+        with self.lock:
+            generation = self.generations.get(root, 0)
+        tee = TeeSocket(client_socket, self.max_entry_bytes)
+        produce(tee)
+        self.store(key, tee.getvalue(), generation)
+
+    def evict(self, repo_path=None):
+        with self.lock:
+            if repo_path is None:
+                removed = list(self.entries)
+            else:
+                root = os.path.abspath(repo_path)
+                removed = [key for key in self.entries if key[0] == root]
+            for key in removed:
+                self.remove(key)
+            return len(removed)
+
+    def repository_changed(self, repo_path):
+        root = os.path.abspath(repo_path)
+        with self.lock:
+            self.generations[root] = self.generations.get(root, 0) + 1
+            for key in [key for key in self.entries if key[0] == root]:
+                self.remove(key)
+                self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+
+output_cache = OutputCache()
+repository_events.attach(output_cache)
+metrics.register_source('output cache', output_cache.stats)
@@ -0,0 +1,94 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from modules.metrics import metrics
+
+
+class HelperPool:
+    def __init__(self, factory, max_size, idle_timeout, name):
+        self.factory = factory
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.name = name
+        self.helpers = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.restarts = 0
+        self.evictions = 0
+        self.spawns_saved = 0
+        metrics.register_source(name, self.stats)
+
+    @contextmanager
+    def acquire(self, repo_path):
+        helper = self.get(repo_path)
+        with helper.lock:
+            helper.last_used = time.monotonic()
+            yield helper
+
+    def get(self, repo_path):
+        key = os.path.abspath(repo_path)
+        with self.lock:
+            self.evict_idle()
+            helper = self.helpers.get(key)
+            if helper is not None and helper.alive():
+                self.helpers.move_to_end(key)
+                self.hits += 1
+                return helper
+            if helper is not None:
+                del self.helpers[key]
+                self.restarts += 1
+                helper.close()
+            self.misses += 1
+
+        helper = self.factory(key)
+        with self.lock:
+            existing = self.helpers.get(key)
+            if existing is not None and existing.alive():
+                helper.close()
+                return existing
+            self.helpers[key] = helper
+            while len(self.helpers) > self.max_size:
+                _, evicted = self.helpers.popitem(last=False)
+                self.close_helper(evicted)
+        return helper
+
+    def record_saved_spawn(self):
+        with self.lock:
+            self.spawns_saved += 1
+
+    def evict_idle(self):
+        deadline = time.monotonic() - self.idle_timeout
+        for key, helper in list(self.helpers.items()):
+            if helper.last_used >= deadline:
+                break
+            if helper.lock.locked():
+                continue
+            del self.helpers[key]
+            self.close_helper(helper)
+
+    def close_helper(self, helper):
+        self.evictions += 1
+        helper.close()
+        logging.info(f"Evicted helper for {helper.repo_path}; {self.describe()}")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'helpers': len(self.helpers),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'restarts': self.restarts,
+            'evictions': self.evictions,
+            'spawns_saved': self.spawns_saved,
+        }
+
+    def describe(self):
+        stats = self.stats()
+        return (f"{self.name}: {stats['helpers']} live, hit rate {stats['hit_rate']:.1%} "
+                f"({stats['hits']} hits, {stats['misses']} misses), {stats['spawns_saved']} spawns saved, "
+                f"{stats['restarts']} restarts, {stats['evictions']} evictions")
@@ -0,0 +1,82 @@
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config.config import (prefetch_interval, prefetch_jitter, prefetch_workers, prefetch_timeout,
+                           prefetch_max_backoff, prefetch_tick)
+from modules import backends, process
+from modules.factories import VCSFA
+from modules.observer import repository_events
+
+def jittered(interval):
+    return interval * random.uniform(1 - prefetch_jitter, 1 + prefetch_jitter)
+
+
+def backoff(failures):
+    return min(prefetch_interval * 2 ** (failures - 1), prefetch_max_backoff)
+
+
+class PrefetchScheduler:
+    def __init__(self, database):
+        self.database = database
+        self.executor = ThreadPoolExecutor(max_workers=prefetch_workers, thread_name_prefix='prefetch')
+        self.running = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self.run, name='prefetch-scheduler', daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self):
+        while not self.stopped.wait(prefetch_tick):
+            try:
+                self.tick()
+            except Exception as e:
+                logging.error(f"Prefetch scheduling failed: {e}")
+
+    def tick(self):
+        now = time.time()
+        states = self.database.fetch_prefetch_states()
+        scheduled = {state[0] for state in states}
+        for _, db_vcs_type, repo_path in self.database.fetch_active_repositories():
+            backend = backends.by_db_name(db_vcs_type)
+            root = os.path.abspath(repo_path)
+            if backend is not None and backend.prefetch and root not in scheduled:
+                scheduled.add(root)
+                self.database.insert_prefetch_state(root, db_vcs_type,
+                                                    now + jittered(prefetch_interval) * random.random())
+        for repo_path, db_vcs_type, next_run, _, failures in states:
+            backend = backends.by_db_name(db_vcs_type)
+            if backend is None or not backend.prefetch or next_run > now or repo_path in self.running:
+                continue
+            if not os.path.isdir(repo_path):
+                continue
+            if not self.database.claim_prefetch(repo_path, now, now + prefetch_timeout):
+                continue
+            with self.lock:
+                self.running.add(repo_path)
+            self.executor.submit(self.prefetch, backend.name, repo_path, failures)
+
+    def prefetch(self, vcs_type, repo_path, failures):
+        started = time.time()
+        try:
+            with process.time_limit(prefetch_timeout):
+                VCSFA().create_vcs(None, vcs_type, self.database).prefetch(repo_path)
+        except Exception as e:
+            failures += 1
+            delay = backoff(failures)
+            logging.warning(f"Prefetch of {repo_path} failed ({failures} in a row), retrying in {delay:.0f}s: {e}")
+            self.database.record_prefetch(repo_path, time.time() + jittered(delay), None, failures, str(e))
+        else:
+            logging.info(f"Prefetched {repo_path} in {time.time() - started:.1f}s")
+            self.database.record_prefetch(repo_path, time.time() + jittered(prefetch_interval), started, 0, None)
+            repository_events.notify(repo_path)
+        finally:
+            with self.lock:
+                self.running.discard(repo_path)
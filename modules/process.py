@@ -0,0 +1,226 @@
+import asyncio
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from config.config import frame_size
+from modules import profiling
+from modules.metrics import metrics
+
+_session = threading.local()
+_running = 0
+_running_lock = threading.Lock()
+
+
+@contextmanager
+def tracked(command=()):
+    global _running
+    with _running_lock:
+        _running += 1
+    try:
+        with metrics.subprocess() as usage, profiling.recorded(command):
+            yield usage
+    finally:
+        with _running_lock:
+            _running -= 1
+
+
+def running():
+    return _running
+
+
+def bind_loop(loop):
+    _session.loop = loop
+
+
+def unbind_loop():
+    _session.loop = None
+
+
+@contextmanager
+def time_limit(seconds):
+    previous = getattr(_session, 'deadline', None)
+    _session.deadline = time.monotonic() + seconds
+    try:
+        yield
+    finally:
+        _session.deadline = previous
+
+
+def remaining(command):
+    deadline = getattr(_session, 'deadline', None)
+    if deadline is None:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise subprocess.TimeoutExpired(command, 0)
+    return left
+
+
+def run(command, cwd=None):
+    loop = getattr(_session, 'loop', None)
+    timeout = remaining(command)
+    with tracked(command) as usage:
+        if loop is not None:
+            coroutine = run_async(command, cwd)
+            if timeout is not None:
+                coroutine = asyncio.wait_for(coroutine, timeout)
+            try:
+                return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+            except asyncio.TimeoutError:
+                raise subprocess.TimeoutExpired(command, timeout)
+        return run_direct(command, cwd, timeout, usage)
+
+
+def run_direct(command, cwd, timeout, usage):
+    with tempfile.TemporaryFile() as stderr:
+        popen = subprocess.Popen(command, cwd=cwd, stdout=subprocess.PIPE, stderr=stderr)
+        timer = start_timer(timeout, popen.kill)
+        try:
+            stdout = popen.stdout.read()
+            reap(popen, usage)
+        finally:
+            stop_timer(timer)
+            if popen.returncode is None:
+                popen.kill()
+                reap(popen, usage)
+            popen.stdout.close()
+        check_timeout(timer, command, timeout)
+        stderr.seek(0)
+        errors = stderr.read().decode('utf-8', errors='replace')
+    stdout = stdout.decode('utf-8', errors='replace')
+    if popen.returncode != 0:
+        raise subprocess.CalledProcessError(popen.returncode, command, stdout, errors)
+    return subprocess.CompletedProcess(command, popen.returncode, stdout, errors)
+
+
+def reap(popen, usage):
+    if not hasattr(os, 'wait4'):
+        popen.wait()
+        return
+    try:
+        _, status, resources = os.wait4(popen.pid, 0)
+    except ChildProcessError:
+        popen.wait()
+        return
+    popen.returncode = os.waitstatus_to_exitcode(status)
+    usage.cpu_seconds = resources.ru_utime + resources.ru_stime
+
+
+async def run_async(command, cwd=None):
+    process = await asyncio.create_subprocess_exec(*command, cwd=cwd,
+                                                   stdout=asyncio.subprocess.PIPE,
+                                                   stderr=asyncio.subprocess.PIPE)
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        process.kill()
+        await process.wait()
+        raise
+    stdout = stdout.decode('utf-8', errors='replace')
+    stderr = stderr.decode('utf-8', errors='replace')
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, stdout, stderr)
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+def stream(command, cwd=None):
+    with tracked(command) as usage:
+        yield from stream_direct(command, cwd, usage)
+
+
+def stream_direct(command, cwd, usage):
+    loop = getattr(_session, 'loop', None)
+    if loop is not None:
+        yield from stream_on_loop(command, cwd, loop)
+        return
+
+    timeout = remaining(command)
+    with tempfile.TemporaryFile() as stderr:
+        popen = subprocess.Popen(command, cwd=cwd, stdout=subprocess.PIPE, stderr=stderr)
+        timer = start_timer(timeout, popen.kill)
+        try:
+            while True:
+                chunk = popen.stdout.read1(frame_size)
+                if not chunk:
+                    break
+                yield chunk
+            reap(popen, usage)
+        finally:
+            stop_timer(timer)
+            if popen.returncode is None:
+                popen.kill()
+                reap(popen, usage)
+            popen.stdout.close()
+        check_timeout(timer, command, timeout)
+        check_returncode(popen.returncode, command, stderr)
+
+
+def stream_on_loop(command, cwd, loop):
+    def call(coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+    timeout = remaining(command)
+    with tempfile.TemporaryFile() as stderr:
+        popen = call(asyncio.create_subprocess_exec(*command, cwd=cwd, stdout=asyncio.subprocess.PIPE, stderr=stderr))
+        timer = start_timer(timeout, lambda: loop.call_soon_threadsafe(popen.kill))
+        try:
+            while True:
+                chunk = call(popen.stdout.read(frame_size))
+                if not chunk:
+                    break
+                yield chunk
+            call(popen.wait())
+        finally:
+            stop_timer(timer)
+            if popen.returncode is None:
+                popen.kill()
+                call(popen.wait())
+        check_timeout(timer, command, timeout)
+        check_returncode(popen.returncode, command, stderr)
+
+
+def start_timer(timeout, kill):
+    if timeout is None:
+        return None
+    expired = threading.Event()
+
+    def expire():
+        expired.set()
+        kill()
+
+    timer = threading.Timer(timeout, expire)
+    timer.daemon = True
+    timer.expired = expired
+    timer.start()
+    return timer
+
+
+def stop_timer(timer):
+    if timer is not None:
+        timer.cancel()
+
+
+def check_timeout(timer, command, timeout):
+    if timer is not None and timer.expired.is_set():
+        raise subprocess.TimeoutExpired(command, timeout)
+
+
+def check_returncode(returncode, command, stderr):
+    if returncode != 0:
+        stderr.seek(0)
+        raise subprocess.CalledProcessError(returncode, command, None,
+                                            stderr.read().decode('utf-8', errors='replace'))
+
+
+def iter_lines(chunks):
+    pending = b''
+    for chunk in chunks:
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + b'\n'
+    if pending:
+        yield pending
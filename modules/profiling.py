@@ -0,0 +1,179 @@
+import cProfile
+import io
+import itertools
+import logging
+import os
+import pstats
+import shlex
+import threading
+import time
+from contextlib import contextmanager
+from config.config import profile_sessions, profile_directory, profile_retention, profile_top_functions
+
+PROFILE_EXTENSIONS = ('.prof', '.txt')
+
+_local = threading.local()
+_sequence = itertools.count(1)
+
+
+def current():
+    return getattr(_local, 'session', None)
+
+
+@contextmanager
+def recorded(command):
+    session = current()
+    if session is None:
+        yield
+        return
+    started = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        session.record_subprocess(command, time.perf_counter() - started, error)
+
+
+def prune(directory=profile_directory, retention=profile_retention):
+    sessions = {}
+    for entry in os.scandir(directory):
+        stem, extension = os.path.splitext(entry.name)
+        if extension in PROFILE_EXTENSIONS:
+            sessions[stem] = max(sessions.get(stem, 0), entry.stat().st_mtime)
+    for stem in sorted(sessions, key=sessions.get)[:max(len(sessions) - retention, 0)]:
+        for extension in PROFILE_EXTENSIONS:
+            path = os.path.join(directory, stem + extension)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class SessionProfiler:
+    def __init__(self, vcs_type, repo_path, enabled=profile_sessions):
+        self.vcs_type = vcs_type
+        self.repo_path = repo_path
+        self.lock = threading.Lock()
+        self.active = False
+        if enabled:
+            self.start()
+
+    def start(self):
+        with self.lock:
+            self.active = True
+            self.started = time.time()
+            self.stats = None
+            self.commands = []
+            self.subprocesses = []
+            self.unprofiled = 0
+
+    def dispatch(self, visit):
+        def run(client_socket, vcs_type, command, facade, repo_path):
+            if not self.active:
+                return visit(client_socket, vcs_type, command, facade, repo_path)
+            return self.profile(visit, client_socket, vcs_type, command, facade, repo_path)
+        return run
+
+    def profile(self, visit, client_socket, vcs_type, command, facade, repo_path):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            profile = None
+        previous = current()
+        _local.session = self
+        started = time.perf_counter()
+        try:
+            return visit(client_socket, vcs_type, command, facade, repo_path)
+        finally:
+            elapsed = time.perf_counter() - started
+            _local.session = previous
+            if profile is not None:
+                profile.disable()
+            with self.lock:
+                self.commands.append((command, elapsed))
+                if profile is None:
+                    self.unprofiled += 1
+                elif self.stats is None:
+                    self.stats = pstats.Stats(profile)
+                else:
+                    self.stats.add(profile)
+
+    def record_subprocess(self, command, elapsed, error):
+        with self.lock:
+            self.subprocesses.append((' '.join(shlex.quote(str(part)) for part in command), elapsed, error))
+
+    def stop(self):
+        with self.lock:
+            self.active = False
+        return self.dump()
+
+    def report(self):
+        command_time = sum(elapsed for _, elapsed in self.commands)
+        subprocess_time = sum(elapsed for _, elapsed, _ in self.subprocesses)
+        lines = [f"Profile of {self.vcs_type} session on {self.repo_path}, "
+                 f"started {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started))}",
+                 f"{len(self.commands)} commands in {command_time:.3f}s, "
+                 f"{len(self.subprocesses)} subprocesses in {subprocess_time:.3f}s "
+                 f"({command_time - subprocess_time:.3f}s outside subprocesses)"]
+        if self.unprofiled:
+            lines.append(f"{self.unprofiled} commands ran without cProfile because another profiler was active.")
+        lines.append("Commands:")
+        lines.extend(f"  {elapsed:>8.3f}s  {command}" for command, elapsed in self.commands)
+        if self.subprocesses:
+            lines.append("Subprocesses:")
+            lines.extend(f"  {elapsed:>8.3f}s  {command}" + (f"  [{error}]" if error else '')
+                         for command, elapsed, error in self.subprocesses)
+        if self.stats is not None:
+            output = io.StringIO()
+            self.stats.stream = output
+            self.stats.sort_stats('cumulative').print_stats(profile_top_functions)
+            lines.append(output.getvalue().rstrip())
+        return '\n'.join(lines) + '\n'
+
+    def dump(self):
+        with self.lock:
+            report = self.report()
+            stats = self.stats
+        os.makedirs(profile_directory, exist_ok=True)
+        name = (f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_sequence)}-{self.vcs_type}-"
+                f"{os.path.basename(os.path.abspath(self.repo_path)) or 'root'}")
+        path = os.path.join(profile_directory, name)
+        with open(path + '.txt', 'w') as output:
+            output.write(report)
+        if stats is not None:
+            stats.dump_stats(path + '.prof')
+        try:
+            prune()
+        except OSError as e:
+            logging.error(f"Could not prune profiles in {profile_directory}: {e}")
+        return report, path
+
+    def control(self, client_socket, command):
+        args = command.lower().split()[1:]
+        try:
+            if args == ['on']:
+                self.start()
+                client_socket.sendall(b"Profiling enabled for this session.\n")
+            elif args == ['off']:
+                if not self.active:
+                    client_socket.sendall(b"Profiling is not enabled.\n")
+                    return
+                report, path = self.stop()
+                client_socket.sendall(f"{report}Profile written to {path}.txt\n".encode('utf-8'))
+            elif not args:
+                state = 'on' if self.active else 'off'
+                client_socket.sendall(f"Profiling is {state}.\n".encode('utf-8'))
+            else:
+                client_socket.sendall(b"Invalid profile command. Usage: profile on|off\n")
+        except OSError as e:
+            client_socket.sendall(f"Error executing 'profile' command: {e}\n".encode('utf-8'))
+
+    def close(self):
+        if self.active:
+            try:
+                _, path = self.stop()
+                logging.info(f"Session profile written to {path}.txt")
+            except OSError as e:
+                logging.error(f"Could not write session profile: {e}")
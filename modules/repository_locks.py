@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from modules.metrics import metrics
+
+UNLOCKED_COMMANDS = {'help', 'stats', 'backups', 'backup_load', 'cache'}
+SHARED_COMMANDS = {'status', 'log', 'search', 'list', 'backup'}
+
+SHARED = 'shared'
+EXCLUSIVE = 'exclusive'
+
+
+def lock_mode(command):
+    if command in UNLOCKED_COMMANDS:
+        return None
+    if command in SHARED_COMMANDS:
+        return SHARED
+    return EXCLUSIVE
+
+
+class RepositoryLock:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.waiting = deque()
+        self.readers = 0
+        self.writer = False
+        self.users = 0
+
+    def admissible(self, ticket, exclusive):
+        if self.waiting[0] is not ticket or self.writer:
+            return False
+        return not exclusive or self.readers == 0
+
+    def acquire(self, exclusive):
+        ticket = object()
+        with self.condition:
+            self.waiting.append(ticket)
+            try:
+                while not self.admissible(ticket, exclusive):
+                    self.condition.wait()
+            except BaseException:
+                self.waiting.remove(ticket)
+                self.condition.notify_all()
+                raise
+            self.waiting.popleft()
+            if exclusive:
+                self.writer = True
+            else:
+                self.readers += 1
+            self.condition.notify_all()
+
+    def release(self, exclusive):
+        with self.condition:
+            if exclusive:
+                self.writer = False
+            else:
+                self.readers -= 1
+            self.condition.notify_all()
+
+
+class RepositoryLockManager:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.locks = {}
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    @contextmanager
+    def locked(self, repo_path, mode):
+        if mode is None or repo_path is None:
+            yield 0.0
+            return
+        root = os.path.abspath(repo_path)
+        with self.lock:
+            repository_lock = self.locks.setdefault(root, RepositoryLock())
+            repository_lock.users += 1
+        exclusive = mode == EXCLUSIVE
+        started = time.monotonic()
+        try:
+            repository_lock.acquire(exclusive)
+        except BaseException:
+            self.leave(root, repository_lock)
+            raise
+        waited = time.monotonic() - started
+        with self.lock:
+            self.waits += 1
+            self.wait_seconds += waited
+        try:
+            yield waited
+        finally:
+            repository_lock.release(exclusive)
+            self.leave(root, repository_lock)
+
+    def leave(self, root, repository_lock):
+        with self.lock:
+            repository_lock.users -= 1
+            if repository_lock.users == 0:
+                del self.locks[root]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'repositories': len(self.locks),
+                'acquisitions': self.waits,
+                'wait_seconds': self.wait_seconds,
+            }
+
+
+repository_locks = RepositoryLockManager()
+metrics.register_source('repository locks', repository_locks.stats)
@@ -0,0 +1,225 @@
+import errno
+import os
+import shutil
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from config.config import restore_workers, restore_link_mode, restore_progress_interval
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+FICLONE = 0x40049409
+FICLONERANGE = 0x4020940D
+CLONE_RANGE = struct.Struct('qQQQ')
+UNSUPPORTED_ERRORS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF,
+                      errno.EPERM}
+SEND_BLOCK = 1 << 30
+O_BINARY = getattr(os, 'O_BINARY', 0)
+
+disabled_methods = set() if fcntl is not None else {'reflink'}
+
+
+def default_workers(path):
+    cpus = os.cpu_count() or 1
+    try:
+        device = os.stat(path).st_dev
+        block = f"/sys/dev/block/{os.major(device)}:{os.minor(device)}"
+        for queue in (os.path.join(block, 'queue'), os.path.join(block, '..', 'queue')):
+            rotational = os.path.join(queue, 'rotational')
+            if os.path.exists(rotational):
+                with open(rotational) as rotational_file:
+                    if rotational_file.read().strip() == '1':
+                        return 2
+                break
+    except (OSError, AttributeError):
+        pass
+    return min(32, cpus * 4)
+
+
+def selected(relative_path, paths):
+    if not paths:
+        return True
+    relative_path = os.path.normpath(relative_path)
+    return any(relative_path == path or relative_path.startswith(path + os.sep) or path.startswith(relative_path + os.sep)
+               for path in paths)
+
+
+def normalize_paths(paths):
+    normalized = []
+    for path in paths or []:
+        path = os.path.normpath(path)
+        if os.path.isabs(path) or path == '..' or path.startswith('..' + os.sep):
+            raise ValueError(f"Invalid restore path '{path}'")
+        normalized.append(path)
+    return normalized
+
+
+def disable(method, error):
+    if error.errno in UNSUPPORTED_ERRORS:
+        disabled_methods.add(method)
+        return True
+    return False
+
+
+def clone_range(source_fd, target_fd, length, source_offset, target_offset):
+    if 'reflink' in disabled_methods or restore_link_mode not in ('reflink', 'hardlink'):
+        return False
+    try:
+        fcntl.ioctl(target_fd, FICLONERANGE, CLONE_RANGE.pack(source_fd, source_offset, length, target_offset))
+        return True
+    except OSError as e:
+        if e.errno in (errno.EINVAL, errno.EXDEV):
+            return False
+        if disable('reflink', e):
+            return False
+        raise
+
+
+def copy_range(source_fd, target_fd, length, source_offset=0, target_offset=0):
+    if length and clone_range(source_fd, target_fd, length, source_offset, target_offset):
+        return length
+    copied = 0
+    if 'copy_file_range' not in disabled_methods and hasattr(os, 'copy_file_range'):
+        try:
+            while copied < length:
+                sent = os.copy_file_range(source_fd, target_fd, length - copied,
+                                          source_offset + copied, target_offset + copied)
+                if sent == 0:
+                    break
+                copied += sent
+            if copied == length:
+                return copied
+        except OSError as e:
+            if not disable('copy_file_range', e):
+                raise
+    if 'sendfile' not in disabled_methods and hasattr(os, 'sendfile'):
+        try:
+            os.lseek(target_fd, target_offset + copied, os.SEEK_SET)
+            while copied < length:
+                sent = os.sendfile(target_fd, source_fd, source_offset + copied, min(length - copied, SEND_BLOCK))
+                if sent == 0:
+                    break
+                copied += sent
+            if copied == length:
+                return copied
+        except OSError as e:
+            if not disable('sendfile', e):
+                raise
+    if not hasattr(os, 'pread'):
+        return copy_sequential(source_fd, target_fd, length, source_offset + copied, target_offset + copied) + copied
+    while copied < length:
+        data = os.pread(source_fd, min(length - copied, 1 << 20), source_offset + copied)
+        if not data:
+            break
+        copied += os.pwrite(target_fd, data, target_offset + copied)
+    return copied
+
+
+def copy_sequential(source_fd, target_fd, length, source_offset, target_offset):
+    os.lseek(source_fd, source_offset, os.SEEK_SET)
+    os.lseek(target_fd, target_offset, os.SEEK_SET)
+    copied = 0
+    while copied < length:
+        data = os.read(source_fd, min(length - copied, 1 << 20))
+        if not data:
+            break
+        copied += os.write(target_fd, data)
+    return copied
+
+
+def copy_file(source, destination):
+    if os.path.lexists(destination):
+        os.remove(destination)
+    if restore_link_mode == 'hardlink' and 'hardlink' not in disabled_methods:
+        try:
+            os.link(source, destination)
+            return os.stat(destination).st_size
+        except OSError as e:
+            if not disable('hardlink', e):
+                raise
+    source_fd = os.open(source, os.O_RDONLY | O_BINARY)
+    try:
+        length = os.fstat(source_fd).st_size
+        target_fd = os.open(destination, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | O_BINARY, 0o600)
+        try:
+            if 'reflink' not in disabled_methods and restore_link_mode in ('reflink', 'hardlink'):
+                try:
+                    fcntl.ioctl(target_fd, FICLONE, source_fd)
+                    return length
+                except OSError as e:
+                    if not disable('reflink', e):
+                        raise
+            copy_range(source_fd, target_fd, length)
+        finally:
+            os.close(target_fd)
+    finally:
+        os.close(source_fd)
+    shutil.copystat(source, destination, follow_symlinks=False)
+    return length
+
+
+def run_parallel(tasks, progress=None, workers=None):
+    total_files = len(tasks)
+    total_bytes = sum(size for size, _ in tasks)
+    restored_files = 0
+    restored_bytes = 0
+    reported_at = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='restore') as executor:
+        futures = [executor.submit(task) for _, task in tasks]
+        try:
+            for future in as_completed(futures):
+                restored_bytes += future.result()
+                restored_files += 1
+                now = time.monotonic()
+                if progress is not None and now - reported_at >= restore_progress_interval:
+                    reported_at = now
+                    progress(restored_files, total_files, restored_bytes, total_bytes)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    return restored_files, restored_bytes
+
+
+def restore_directory(source, target, paths=None, progress=None):
+    paths = normalize_paths(paths)
+    os.makedirs(target, exist_ok=True)
+    directories = []
+    tasks = []
+    links = []
+    for dirpath, dirnames, filenames in os.walk(source):
+        relative_dir = os.path.relpath(dirpath, source)
+        for dirname in list(dirnames):
+            if os.path.islink(os.path.join(dirpath, dirname)):
+                dirnames.remove(dirname)
+                filenames.append(dirname)
+        dirnames[:] = [name for name in dirnames if selected(os.path.join(relative_dir, name), paths)]
+        for dirname in dirnames:
+            relative_path = os.path.normpath(os.path.join(relative_dir, dirname))
+            os.makedirs(os.path.join(target, relative_path), exist_ok=True)
+            directories.append(relative_path)
+        for filename in filenames:
+            relative_path = os.path.normpath(os.path.join(relative_dir, filename))
+            if not selected(relative_path, paths):
+                continue
+            full_path = os.path.join(dirpath, filename)
+            destination = os.path.join(target, relative_path)
+            if os.path.islink(full_path):
+                links.append((os.readlink(full_path), destination))
+            else:
+                tasks.append((os.lstat(full_path).st_size,
+                              lambda full_path=full_path, destination=destination: copy_file(full_path, destination)))
+
+    workers = restore_workers or default_workers(target)
+    restored = run_parallel(tasks, progress, workers)
+    for link_target, destination in links:
+        if os.path.lexists(destination):
+            os.remove(destination)
+        os.symlink(link_target, destination)
+    for relative_path in reversed(directories):
+        shutil.copystat(os.path.join(source, relative_path), os.path.join(target, relative_path))
+    return restored
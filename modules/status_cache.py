@@ -0,0 +1,279 @@
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from config.config import status_cache_size, status_watch, status_poll_interval
+from modules.metrics import metrics
+from modules.observer import RepositoryObserver, repository_events
+
+SKIPPED_METADATA = {'.git': {'objects'}, '.hg': {'store', 'cache'}, '.svn': {'pristine', 'tmp'}}
+IGNORED_NAMES = {b'lock', b'wlock'}
+IGNORED_SUFFIXES = (b'.lock', b'-journal')
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF)
+EVENT = struct.Struct('iIII')
+
+
+def walk_tree(root):
+    for dirpath, dirnames, filenames in os.walk(root):
+        skipped = SKIPPED_METADATA.get(os.path.basename(dirpath))
+        if skipped and os.path.dirname(dirpath) == root:
+            dirnames[:] = [name for name in dirnames if name not in skipped]
+        yield dirpath, dirnames, filenames
+
+
+def fingerprint(root):
+    digest = hashlib.blake2b(digest_size=16)
+    for dirpath, dirnames, filenames in walk_tree(root):
+        for name in dirnames + filenames:
+            try:
+                stat = os.lstat(os.path.join(dirpath, name))
+            except FileNotFoundError:
+                continue
+            digest.update(f"{dirpath}/{name}\0{stat.st_mtime_ns}\0{stat.st_size}\n".encode('utf-8', 'surrogateescape'))
+    return digest.digest()
+
+
+class InotifyWatcher:
+    def __init__(self, on_change):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.on_change = on_change
+        self.watches = {}
+        self.roots = {}
+        self.lock = threading.Lock()
+        threading.Thread(target=self.run, name='status-inotify', daemon=True).start()
+
+    def watch(self, root):
+        try:
+            self.watch_tree(root, walk_tree(root))
+        except OSError:
+            self.unwatch(root)
+            raise
+
+    def watch_tree(self, root, tree):
+        for dirpath, _, _ in tree:
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirpath), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOENT:
+                    continue
+                raise OSError(error, os.strerror(error), dirpath)
+            with self.lock:
+                self.watches[wd] = (root, dirpath)
+                self.roots.setdefault(root, set()).add(wd)
+
+    def unwatch(self, root):
+        with self.lock:
+            wds = self.roots.pop(root, set())
+            for wd in wds:
+                self.watches.pop(wd, None)
+        for wd in wds:
+            self.libc.inotify_rm_watch(self.fd, wd)
+
+    def run(self):
+        while True:
+            select.select([self.fd], [], [])
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                continue
+            changed = set()
+            created = []
+            offset = 0
+            with self.lock:
+                while offset < len(data):
+                    wd, mask, _, length = EVENT.unpack_from(data, offset)
+                    name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b'\0')
+                    offset += EVENT.size + length
+                    if mask & IN_Q_OVERFLOW:
+                        changed.update(self.roots)
+                        continue
+                    watch = self.watches.get(wd)
+                    if watch is None:
+                        continue
+                    root, dirpath = watch
+                    if name in IGNORED_NAMES or name.endswith(IGNORED_SUFFIXES):
+                        continue
+                    changed.add(root)
+                    if mask & IN_IGNORED:
+                        del self.watches[wd]
+                        self.roots.get(root, set()).discard(wd)
+                    elif mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                        created.append((root, os.path.join(dirpath, os.fsdecode(name))))
+            for root, dirpath in created:
+                with self.lock:
+                    if root not in self.roots:
+                        continue
+                try:
+                    self.watch_tree(root, os.walk(dirpath))
+                except OSError as e:
+                    logging.warning(f"Cannot watch new directory {dirpath}: {e}")
+            for root in changed:
+                self.on_change(root)
+
+
+class PollingWatcher:
+    def __init__(self, on_change, interval):
+        self.on_change = on_change
+        self.interval = interval
+        self.fingerprints = {}
+        self.lock = threading.Lock()
+        threading.Thread(target=self.run, name='status-poll', daemon=True).start()
+
+    def watch(self, root):
+        current = fingerprint(root)
+        with self.lock:
+            self.fingerprints[root] = current
+
+    def unwatch(self, root):
+        with self.lock:
+            self.fingerprints.pop(root, None)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                roots = list(self.fingerprints)
+            for root in roots:
+                try:
+                    current = fingerprint(root)
+                except OSError:
+                    current = None
+                with self.lock:
+                    if root not in self.fingerprints or self.fingerprints[root] == current:
+                        continue
+                    self.fingerprints[root] = current
+                self.on_change(root)
+
+
+class StatusCache(RepositoryObserver):
+    def __init__(self, max_size=status_cache_size, watch_mode=status_watch, poll_interval=status_poll_interval):
+        self.max_size = max_size
+        self.watch_mode = watch_mode
+        self.poll_interval = poll_interval
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.watched = {}
+        self.inotify = None
+        self.poller = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, repo_path, vcs_type, compute):
+        root = os.path.abspath(repo_path)
+        key = (root, vcs_type)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            generation = self.generations.get(root, 0)
+
+        watching = self.ensure_watched(root)
+        result = compute()
+        if watching:
+            with self.lock:
+                if result is not None and self.generations.get(root, 0) == generation and root in self.watched:
+                    self.entries[key] = result
+                    self.evict()
+                else:
+                    self.release(root)
+        return result
+
+    def evict(self):
+        while len(self.entries) > self.max_size:
+            (root, _), _ = self.entries.popitem(last=False)
+            self.release(root)
+
+    def release(self, root):
+        if not any(cached_root == root for cached_root, _ in self.entries):
+            watcher = self.watched.pop(root, None)
+            if watcher is not None:
+                watcher.unwatch(root)
+
+    def ensure_watched(self, root):
+        with self.lock:
+            if root in self.watched:
+                return True
+        for watcher in self.watchers():
+            try:
+                watcher.watch(root)
+            except OSError as e:
+                logging.warning(f"Cannot watch {root} for status changes: {e}")
+                continue
+            with self.lock:
+                if root in self.watched:
+                    watcher.unwatch(root)
+                else:
+                    self.watched[root] = watcher
+            return True
+        return False
+
+    def watchers(self):
+        if self.watch_mode in ('auto', 'inotify') and sys.platform.startswith('linux'):
+            if self.inotify is None:
+                try:
+                    self.inotify = InotifyWatcher(self.repository_changed)
+                except OSError as e:
+                    logging.warning(f"inotify is unavailable, falling back to polling: {e}")
+                    self.watch_mode = 'poll'
+            if self.inotify is not None:
+                yield self.inotify
+        if self.watch_mode in ('auto', 'poll'):
+            if self.poller is None:
+                self.poller = PollingWatcher(self.repository_changed, self.poll_interval)
+            yield self.poller
+
+    def repository_changed(self, repo_path):
+        root = os.path.abspath(repo_path)
+        with self.lock:
+            self.generations[root] = self.generations.get(root, 0) + 1
+            for key in [key for key in self.entries if key[0] == root]:
+                del self.entries[key]
+                self.invalidations += 1
+            self.release(root)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'watched': len(self.watched),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'invalidations': self.invalidations,
+        }
+
+
+status_cache = StatusCache()
+repository_events.attach(status_cache)
+metrics.register_source('status cache', status_cache.stats)
@@ -1,7 +1,14 @@
 import os
 import subprocess
+from datetime import datetime
+from xml.etree import ElementTree
+from modules import process
+from modules.commit_index import Commit
+from modules.status_cache import status_cache
 from modules.vcs import VCSInterface
 
+LOG_SEPARATOR = b'-' * 72
+
 
 class SVN(VCSInterface):
     def __init__(self, client_socket, database):
@@ -14,12 +21,20 @@ class SVN(VCSInterface):
 
     def run_command(self, command, repo_path):
         try:
-            result = subprocess.run(command, cwd=repo_path, capture_output=True, text=True, check=True)
+            result = process.run(command, cwd=repo_path)
             return result.stdout.strip()
         except subprocess.CalledProcessError as e:
             error_message = f"Error executing '{' '.join(e.cmd)}' command: {e.stderr}\n"
             self.client_socket.sendall(error_message.encode('utf-8'))
 
+    def stream_command(self, command, repo_path):
+        try:
+            for chunk in process.stream(command, cwd=repo_path):
+                self.client_socket.sendall(chunk)
+        except subprocess.CalledProcessError as e:
+            error_message = f"Error executing '{' '.join(e.cmd)}' command: {e.stderr}\n"
+            self.client_socket.sendall(error_message.encode('utf-8'))
+
     def add(self, repo_path, files):
         try:
             if files is None:
@@ -78,6 +93,7 @@ class SVN(VCSInterface):
                 svn_checkout_command = ['svn', 'checkout', repository_name, '.']
                 self.run_command(svn_checkout_command, repo_path)
                 message = "SVN: Repository initialized successfully."
+                self.database.insert_repository(repository_name, "SVN", repo_path)
             else:
                 message = "SVN: Repository already exists."
 
@@ -85,18 +101,76 @@ class SVN(VCSInterface):
         except Exception as e:
             self.client_socket.sendall(f"Error executing 'init' command: {str(e)}\n")
 
-    def log(self, repo_path):
+    def log(self, repo_path, limit=None, offset=None, since=None, until=None, path=None):
         try:
             svn_log_command = ['svn', 'log', '--verbose']
-            log_output = self.run_command(svn_log_command, repo_path)
-            self.client_socket.sendall(log_output.encode('utf-8'))
+            if limit is not None:
+                svn_log_command += ['--limit', str(limit + (offset or 0))]
+            if since is not None or until is not None:
+                start = f'{{{until}}}' if until is not None else 'BASE'
+                end = f'{{{since}}}' if since is not None else '1'
+                svn_log_command += ['-r', f'{start}:{end}']
+            if path is not None:
+                svn_log_command.append(path)
+
+            if not offset:
+                self.stream_command(svn_log_command, repo_path)
+                return
+            lines = process.iter_lines(process.stream(svn_log_command, cwd=repo_path))
+            for line in skip_log_entries(lines, offset):
+                self.client_socket.sendall(line)
+        except subprocess.CalledProcessError as e:
+            self.client_socket.sendall(f"Error executing '{' '.join(e.cmd)}' command: {e.stderr}\n".encode('utf-8'))
         except Exception as e:
             self.client_socket.sendall(f"Error executing 'log' command: {str(e)}\n")
 
+    def history_head(self, repo_path):
+        return process.run(['svn', 'info', '--show-item', 'revision', '-r', 'HEAD'], cwd=repo_path).stdout.strip()
+
+    def cache_revision(self, repo_path):
+        return process.run(['svn', 'info', '--show-item', 'revision'], cwd=repo_path).stdout.strip()
+
+    def iter_commits(self, repo_path, since_revision=None):
+        start = int(since_revision) + 1 if since_revision is not None else 1
+        command = ['svn', 'log', '--xml', '--verbose', '-r', f'{start}:HEAD']
+        parser = ElementTree.XMLPullParser(['end'])
+        for chunk in process.stream(command, cwd=repo_path):
+            parser.feed(chunk)
+            for _, element in parser.read_events():
+                if element.tag != 'logentry':
+                    continue
+                date = datetime.strptime(element.findtext('date')[:19], '%Y-%m-%dT%H:%M:%S')
+                yield Commit(element.get('revision'), element.findtext('author', ''), date.strftime('%Y-%m-%d %H:%M:%S'),
+                             (element.findtext('msg') or '').strip(), [path.text for path in element.iter('path')])
+                element.clear()
+
+    def history_state(self, repo_path):
+        url = process.run(['svn', 'info', '--show-item', 'repos-root-url'], cwd=repo_path).stdout.strip()
+        return {'url': url, 'revision': int(self.history_head(repo_path))}
+
+    def create_bundle(self, repo_path, previous_state, state, output_path):
+        incremental = previous_state is not None and previous_state['url'] == state['url']
+        start = previous_state['revision'] + 1 if incremental else 0
+        if start > state['revision']:
+            return None
+        command = ['svnrdump', 'dump', '--quiet', '-r', f"{start}:{state['revision']}", state['url']]
+        if incremental:
+            command.insert(2, '--incremental')
+        with open(output_path, 'wb') as dump_file:
+            for chunk in process.stream(command, cwd=repo_path):
+                dump_file.write(chunk)
+        return 'incremental' if incremental else 'full'
+
+    def restore_bundles(self, bundle_paths, state, target):
+        process.run(['svnadmin', 'create', target])
+        for bundle_path in bundle_paths:
+            process.run(['svnadmin', 'load', '--quiet', '--file', os.path.abspath(bundle_path), target])
+
     def status(self, repo_path):
         try:
             svn_status_command = ['svn', 'status']
-            status_output = self.run_command(svn_status_command, repo_path)
+            status_output = status_cache.get(repo_path, self.vcs_type,
+                                             lambda: self.run_command(svn_status_command, repo_path))
             self.client_socket.sendall(status_output.encode('utf-8'))
         except Exception as e:
             self.client_socket.sendall(f"Error executing 'status' command: {str(e)}\n")
@@ -163,3 +237,13 @@ class SVN(VCSInterface):
             self.client_socket.sendall(message.encode('utf-8'))
         except Exception as e:
             self.client_socket.sendall(f"Error executing 'tag' command: {str(e)}\n")
+
+
+def skip_log_entries(lines, offset):
+    separators = 0
+    for line in lines:
+        if line.rstrip() == LOG_SEPARATOR:
+            separators += 1
+        if separators > offset:
+            yield line
+
@@ -14,7 +14,7 @@ class VCSInterface:
 
     def init_repo(self, repository_name, repo_path):pass
 
-    def log(self, repo_path):pass
+    def log(self, repo_path, limit=None, offset=None, since=None, until=None, path=None):pass
 
     def status(self, repo_path):pass
 
@@ -36,4 +36,16 @@ class VCSInterface:
 
     def tag(self, repo_path, tag_name, commit_sha=None):pass
 
+    def history_head(self, repo_path):pass
 
+    def cache_revision(self, repo_path):pass
+
+    def iter_commits(self, repo_path, since_revision=None):pass
+
+    def history_state(self, repo_path):pass
+
+    def create_bundle(self, repo_path, previous_state, state, output_path):pass
+
+    def restore_bundles(self, bundle_paths, state, target):pass
+
+    def prefetch(self, repo_path):pass
@@ -1,137 +1,288 @@
 import os
-import shutil
+import shlex
+from collections import namedtuple
 from config.config import backup_directory
+from modules.backup import BackupStore, parse_backup_name
+from modules.metrics import metrics
+from modules.output_cache import output_cache
+from modules.repository_locks import lock_mode, repository_locks
+from modules.restore import restore_directory
 from utils.utils import help
 
+Request = namedtuple('Request', ['name', 'text', 'args', 'options'])
+Route = namedtuple('Route', ['name', 'handler', 'arguments', 'options', 'lock'])
+
+NO_ARGUMENTS = 'none'
+TEXT_ARGUMENT = 'text'
+LIST_ARGUMENT = 'list'
+WORD_ARGUMENTS = 'words'
+OPTION_ARGUMENTS = 'options'
+
+
+def arguments(kind, options=None):
+    def declare(handler):
+        handler.arguments = kind
+        handler.options = options
+        return handler
+    return declare
+
+
+def split_words(text):
+    words = []
+    for word in shlex.split(text, posix=False):
+        if len(word) >= 2 and word[0] == word[-1] and word[0] in ('"', "'"):
+            word = word[1:-1]
+        words.append(word)
+    return words
+
+
+def parse_options(words, schema):
+    options = {}
+    words = list(words)
+    while words:
+        option = words.pop(0)
+        name = option[2:] if option.startswith('--') else None
+        if name not in schema:
+            raise ValueError(f"Unknown option '{option}'")
+        if not words:
+            raise ValueError(f"Option '{option}' requires a value")
+        options[name] = schema[name](words.pop(0))
+    return options
+
+
+def parse_request(route, text, rest):
+    if route.arguments == TEXT_ARGUMENT:
+        if not rest:
+            raise ValueError(f"'{route.name}' requires an argument")
+        return Request(route.name, text, (rest,), {})
+    if route.arguments == LIST_ARGUMENT:
+        if not rest:
+            raise ValueError(f"'{route.name}' requires an argument")
+        return Request(route.name, text, tuple(item.strip() for item in rest.split(',')), {})
+    if route.arguments == WORD_ARGUMENTS:
+        return Request(route.name, text, tuple(split_words(rest)), {})
+    if route.arguments == OPTION_ARGUMENTS:
+        return Request(route.name, text, (), parse_options(split_words(rest), route.options))
+    return Request(route.name, text, (), {})
+
+
+def compile_routes(visitor_class):
+    routes = {}
+    for attribute in dir(visitor_class):
+        if attribute.startswith('visit_') and attribute != 'visit_request':
+            handler = getattr(visitor_class, attribute)
+            name = attribute[len('visit_'):]
+            routes[name] = Route(name, handler, getattr(handler, 'arguments', NO_ARGUMENTS),
+                                 getattr(handler, 'options', None), lock_mode(name))
+    visitor_class.routes = routes
+    return visitor_class
+
+
 class Visitor:
+    routes = {}
+
     def visit(self, client_socket, vcs_type, command, facade, repo_path):
-        method_name = f"visit_{command.lower().split(' ')[0]}"
-        if hasattr(self, method_name):
-            getattr(self, method_name)(client_socket, facade, command, repo_path)
-        else:
+        text = command.strip()
+        name, _, rest = text.partition(' ')
+        route = self.routes.get(name.lower())
+        if route is None:
             client_socket.sendall(f"Invalid {vcs_type} command: {command}\n".encode('utf-8'))
+            return
+        try:
+            request = parse_request(route, text, rest.strip())
+        except ValueError as e:
+            client_socket.sendall(f"Error executing '{route.name}' command: {e}\n".encode('utf-8'))
+            return
+        self.visit_request(client_socket, vcs_type, route, request, facade, repo_path)
 
-class Executor(Visitor):
+    def visit_request(self, client_socket, vcs_type, route, request, facade, repo_path):
+        with metrics.command(route.name, vcs_type, repo_path) as sample:
+            with repository_locks.locked(repo_path, route.lock) as waited:
+                sample.lock_wait_seconds = waited
+                route.handler(self, client_socket, facade, request, repo_path)
 
-    def visit_backup(self, client_socket, facade, command, repo_path):
-        if not os.path.exists(backup_directory):
-            os.makedirs(backup_directory)
-        repo_folder_name = os.path.basename(repo_path)
-        backup_path = os.path.join(backup_directory, f"{repo_folder_name}_backup")
 
+class Executor(Visitor):
+
+    @arguments(WORD_ARGUMENTS)
+    def visit_backup(self, client_socket, facade, request, repo_path):
         try:
-            shutil.copytree(repo_path, backup_path)
-            client_socket.sendall(b"Backup completed successfully.")
+            if request.args == ('--history',):
+                facade.backup_history(repo_path)
+                return
+            manifest, stats = BackupStore().create_snapshot(repo_path)
+            client_socket.sendall((f"Backup completed successfully. Snapshot {manifest['name']}@{manifest['snapshot']}: "
+                                   f"{stats['files']} files, {stats['hashed_files']} rehashed, "
+                                   f"{stats['new_chunks']} new chunks ({stats['new_bytes']} of "
+                                   f"{stats['total_bytes']} bytes stored).").encode('utf-8'))
         except Exception as e:
             client_socket.sendall(f"Error during backup: {e}".encode('utf-8'))
 
-    def visit_backup_load(self,client_socket, facade, command, repo_path):
+    def visit_backups(self, client_socket, facade, request, repo_path):
+        backups = BackupStore().list_backups()
+        histories = facade.list_history_backups()
+        if not backups and not histories:
+            client_socket.sendall(b"No backups found.\n")
+            return
+        response = ''.join(f"{name}: {', '.join(snapshots)}\n" for name, snapshots in backups.items())
+        response += ''.join(f"{name} ({vcs_type} history): snapshots 1-{sequence}, {size} bytes\n"
+                            for name, vcs_type, sequence, size in histories)
+        client_socket.sendall(response.encode('utf-8'))
+
+    @arguments(WORD_ARGUMENTS)
+    def visit_backup_load(self,client_socket, facade, request, repo_path):
         try:
-            _, backup_name, local_path = command.split(maxsplit=2)
+            args = request.args
+            if len(args) < 2:
+                raise ValueError("Usage: backup_load <name[@snapshot]> <local_path> [path ...]")
+            if args[0] == '--history':
+                if len(args) != 3:
+                    raise ValueError("Usage: backup_load --history <name[@sequence]> <local_path>")
+                name, sequence = parse_backup_name(args[1])
+                facade.load_history_backup(name, int(sequence) if sequence is not None else None, args[2])
+                return
+            backup_name, local_path, paths = args[0], args[1], args[2:]
             backup_path = os.path.join(backup_directory, backup_name)
+            store = BackupStore()
+            manifest = store.load_manifest(*parse_backup_name(backup_name))
+
+            def progress(files, total_files, restored_bytes, total_bytes):
+                client_socket.sendall(f"Restored {files}/{total_files} files "
+                                      f"({restored_bytes}/{total_bytes} bytes)\n".encode('utf-8'))
 
-            if os.path.exists(backup_path):
-                if not os.path.exists(local_path):
-                    os.makedirs(local_path)
-                for item in os.listdir(backup_path):
-                    source = os.path.join(backup_path, item)
-                    destination = os.path.join(local_path, item)
-                    if os.path.isdir(source):
-                        shutil.copytree(source, destination)
-                    else:
-                        shutil.copy2(source, destination)
-
-                client_socket.sendall(b"Backup loaded successfully.")
+            if manifest is not None:
+                files, restored_bytes = store.restore(manifest, local_path, paths, progress)
+                client_socket.sendall(f"Backup loaded successfully. Restored {files} files ({restored_bytes} bytes) "
+                                      f"from snapshot {manifest['snapshot']}.".encode('utf-8'))
+            elif os.path.isdir(backup_path) and backup_name not in ('chunks', 'manifests'):
+                files, restored_bytes = restore_directory(backup_path, local_path, paths, progress)
+                client_socket.sendall(f"Backup loaded successfully. Restored {files} files "
+                                      f"({restored_bytes} bytes).".encode('utf-8'))
             else:
                 client_socket.sendall(f"Backup '{backup_name}' not found on the server.\n".encode('utf-8'))
         except Exception as e:
             client_socket.sendall(f"Error loading backup: {str(e)}\n".encode('utf-8'))
 
-    def visit_commit(self, client_socket,facade,command,repo_path):
+    def visit_stats(self, client_socket, facade, request, repo_path):
+        client_socket.sendall(metrics.render_text().encode('utf-8'))
+
+    @arguments(WORD_ARGUMENTS)
+    def visit_cache(self, client_socket, facade, request, repo_path):
+        if request.args != ('clear',):
+            client_socket.sendall(b"Invalid cache command. Usage: cache clear\n")
+            return
+        removed = output_cache.evict(repo_path)
+        client_socket.sendall(f"Removed {removed} cached outputs for {repo_path}.\n".encode('utf-8'))
+
+    @arguments(TEXT_ARGUMENT)
+    def visit_commit(self, client_socket,facade,request,repo_path):
         try:
-            _, comment = command.split(maxsplit=1)
+            comment, = request.args
             facade.commit_changes(repo_path, comment)
         except Exception as e:
             client_socket.sendall(f"Error executing 'commit' command: {str(e)}\n".encode('utf-8'))
 
-    def visit_update(self, client_socket,facade,command,repo_path):
+    def visit_update(self, client_socket,facade,request,repo_path):
         try:
             facade.update_repository(repo_path)
         except Exception as e:
             client_socket.sendall(f"Error executing 'update' command: {str(e)}\n".encode('utf-8'))
 
-    def visit_push(self, client_socket,facade,command,repo_path):
+    def visit_push(self, client_socket,facade,request,repo_path):
         try:
             facade.push_changes(repo_path)
         except Exception as e:
             client_socket.sendall(f"Error executing 'push' command: {str(e)}\n".encode('utf-8'))
 
-    def visit_help(self, client_socket,facade,command,repo_path):
+    def visit_help(self, client_socket,facade,request,repo_path):
         help(client_socket)
 
-    def visit_init(self, client_socket,facade,command,repo_path):
+    @arguments(TEXT_ARGUMENT)
+    def visit_init(self, client_socket,facade,request,repo_path):
         try:
-            _, repository_name = command.split(maxsplit=1)
+            repository_name, = request.args
             facade.initialize_repository(repository_name, repo_path)
         except Exception as e:
             client_socket.sendall(f"Error executing 'init' command: {str(e)}\n".encode('utf-8'))
 
-    def visit_log(self, client_socket,facade,command,repo_path):
+    @arguments(OPTION_ARGUMENTS, {'limit': int, 'offset': int, 'since': str, 'until': str, 'path': str, 'author': str})
+    def visit_log(self, client_socket,facade,request,repo_path):
         try:
-            facade.view_commit_history(repo_path)
+            options = request.options
+            if 'author' in options and 'path' in options:
+                raise ValueError("--author cannot be combined with --path")
+            if 'author' in options or (('since' in options or 'until' in options) and 'path' not in options):
+                facade.query_commit_history(repo_path, **options)
+            else:
+                facade.view_commit_history(repo_path, **options)
         except Exception as e:
             client_socket.sendall(f"Error executing 'log' command: {str(e)}\n".encode('utf-8'))
 
-    def visit_status(self, client_socket,facade,command,repo_path):
+    @arguments(TEXT_ARGUMENT)
+    def visit_search(self, client_socket,facade,request,repo_path):
+        try:
+            text, = request.args
+            facade.search_commit_history(repo_path, text)
+        except Exception as e:
+            client_socket.sendall(f"Error executing 'search' command: {str(e)}\n".encode('utf-8'))
+
+    def visit_status(self, client_socket,facade,request,repo_path):
         try:
             facade.view_repository_status(repo_path)
         except Exception as e:
             client_socket.sendall(f"Error executing 'status' command: {str(e)}\n".encode('utf-8'))
 
-    def visit_add(self, client_socket,facade,command,repo_path):
+    @arguments(LIST_ARGUMENT)
+    def visit_add(self, client_socket,facade,request,repo_path):
         try:
-            _, files_input = command.split(maxsplit=1)
-            files = [file.strip() for file in files_input.split(',')]
-            facade.add_files(repo_path, files)
+            facade.add_files(repo_path, list(request.args))
         except Exception as e:
             client_socket.sendall(f"Error executing 'add' command: {str(e)}\n".encode('utf-8'))
 
-    def visit_add_all(self, client_socket,facade,command,repo_path):
+    def visit_add_all(self, client_socket,facade,request,repo_path):
         try:
             facade.add_all_changes(repo_path)
         except Exception as e:
             client_socket.sendall(f"Error executing 'add_all' command: {str(e)}\n".encode('utf-8'))
 
-    def visit_patch(self, client_socket,facade,command,repo_path):
+    @arguments(TEXT_ARGUMENT)
+    def visit_patch(self, client_socket,facade,request,repo_path):
         try:
-            _, patch_file_path = command.split(maxsplit=1)
+            patch_file_path, = request.args
             facade.apply_patch(repo_path, patch_file_path)
         except Exception as e:
             client_socket.sendall(f"Error executing 'patch' command: {str(e)}\n".encode('utf-8'))
 
-    def visit_branch(self, client_socket,facade,command,repo_path):
+    @arguments(TEXT_ARGUMENT)
+    def visit_branch(self, client_socket,facade,request,repo_path):
         try:
-            _, branch_name = command.split(maxsplit=1)
+            branch_name, = request.args
             facade.create_branch(repo_path, branch_name)
         except Exception as e:
             client_socket.sendall(f"Error executing 'branch' command: {str(e)}\n".encode('utf-8'))
 
-    def visit_merge(self, client_socket,facade,command,repo_path):
+    @arguments(TEXT_ARGUMENT)
+    def visit_merge(self, client_socket,facade,request,repo_path):
         try:
-            _, branch_name = command.split(maxsplit=1)
+            branch_name, = request.args
             facade.merge_branch(repo_path, branch_name)
         except Exception as e:
             client_socket.sendall(f"Error executing 'merge' command: {str(e)}\n".encode('utf-8'))
 
-    def visit_tag(self, client_socket,facade,command,repo_path):
+    @arguments(TEXT_ARGUMENT)
+    def visit_tag(self, client_socket,facade,request,repo_path):
         try:
-            _, tag_name = command.split(maxsplit=1)
+            tag_name, = request.args
             facade.create_tag(repo_path, tag_name)
         except Exception as e:
             client_socket.sendall(f"Error executing 'tag' command: {str(e)}\n".encode('utf-8'))
 
-    def visit_list(self, client_socket,facade,command,repo_path):
+    def visit_list(self, client_socket,facade,request,repo_path):
         try:
             facade.list(repo_path)
         except Exception as e:
-            client_socket.sendall(f"Error executing 'list' command: {str(e)}\n".encode('utf-8'))
\ No newline at end of file
+            client_socket.sendall(f"Error executing 'list' command: {str(e)}\n".encode('utf-8'))
+
+
+compile_routes(Executor)
+command_executor = Executor()
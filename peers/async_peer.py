@@ -0,0 +1,219 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from config.config import db_name, async_workers, handshake_timeout, frame_size
+from db.database import DataBase
+from modules import backends, process
+from modules.facade import VCSF
+from modules.fanout import fan_out
+from modules.factories import VCSFA
+from modules.batch import run_batch_async
+from modules.itarator import CommandIterator
+from modules.metrics import metrics
+from modules.profiling import SessionProfiler
+from modules.visitor import command_executor
+from peers.load import peer_load
+from peers.protocol import (MAGIC, MSG_HELLO, MSG_COMMAND, MSG_REDIRECT, FLAG_END, FrameDecoder, ResponseFramer,
+                            PeerRedirect, ProtocolError, accept_hello, encode_frame, set_nodelay)
+from utils.utils import show_active_repositories, show_menu
+
+
+class AsyncClientSocket:
+    def __init__(self, reader, writer, loop):
+        self.reader = reader
+        self.writer = writer
+        self.loop = loop
+        set_nodelay(writer.get_extra_info('socket'))
+        self.framed = False
+        self.redirects = False
+        self.pending = b''
+        self.decoder = FrameDecoder()
+        self.framer = ResponseFramer()
+
+    async def negotiate(self):
+        try:
+            head = await asyncio.wait_for(self.reader.readexactly(len(MAGIC)), handshake_timeout)
+        except asyncio.TimeoutError:
+            return
+        except asyncio.IncompleteReadError as exp:
+            self.pending = exp.partial
+            return
+        if head != MAGIC:
+            self.pending = head
+            return
+        hello = await self.read_frame()
+        if hello.msg_type != MSG_HELLO:
+            raise ProtocolError("Expected a hello frame after the protocol magic")
+        reply, self.redirects, self.framer.algorithm = accept_hello(hello.payload)
+        self.writer.write(encode_frame(MSG_HELLO, 0, reply))
+        self.framed = True
+
+    async def read_frame(self):
+        while True:
+            frame = self.decoder.next_frame()
+            if frame is not None:
+                return frame
+            data = await self.reader.read(frame_size)
+            if not data:
+                raise ConnectionResetError("Peer closed the connection")
+            self.decoder.feed(data)
+
+    def sendall(self, data):
+        if self.framed:
+            data = self.framer.data(data)
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is self.loop:
+            self.writer.write(data)
+        else:
+            asyncio.run_coroutine_threadsafe(self.write(data), self.loop).result()
+
+    async def send(self, data):
+        if self.framed:
+            data = self.framer.data(data)
+        await self.write(data)
+
+    async def write(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def recv(self, bufsize):
+        if self.framed:
+            await self.write(self.framer.end())
+            while True:
+                frame = await self.read_frame()
+                if frame.msg_type == MSG_COMMAND:
+                    self.framer.begin(frame.request_id)
+                    return frame.payload
+        if self.pending:
+            data, self.pending = self.pending, b''
+            return data
+        data = await self.reader.read(bufsize)
+        if not data:
+            raise ConnectionResetError("Peer closed the connection")
+        return data
+
+    async def redirect(self, host, port, replay=()):
+        self.framer.open = False
+        await self.write(encode_frame(MSG_REDIRECT, self.framer.request_id,
+                                      PeerRedirect(host, port, list(replay)).encode(), FLAG_END))
+
+    async def close(self):
+        if self.framed:
+            self.writer.write(self.framer.end())
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+def call_in_session(loop, func, *args):
+    process.bind_loop(loop)
+    try:
+        return func(*args)
+    finally:
+        process.unbind_loop()
+
+
+async def run_blocking(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, partial(metrics.enqueued(call_in_session), loop, func, *args))
+
+
+async def handle_peer(client_socket, db, registry=None):
+    show_menu(client_socket)
+    while True:
+        command = (await client_socket.recv(1024)).decode('utf-8').strip()
+        vcs_type = backends.resolve(command)
+        if vcs_type is not None:
+            await client_socket.send(b"Enter path to " + vcs_type.encode('utf-8') + b" repository: ")
+            repo_path = (await client_socket.recv(1024)).decode('utf-8').strip()
+            if registry is not None and client_socket.redirects:
+                target = await run_blocking(registry.redirect_target, repo_path)
+                if target is not None:
+                    await client_socket.redirect(*target, replay=[vcs_type, repo_path])
+                    break
+            adapter = VCSFA().create_vcs(client_socket, vcs_type, db)
+            facade = VCSF(adapter)
+            await process_vcs_commands(client_socket, facade, vcs_type, repo_path, db)
+            show_menu(client_socket)
+        elif command.lower().split()[:1] == ["sar"]:
+            await run_blocking(show_active_repositories, db, client_socket, command)
+        elif command.lower().split()[:1] == ["all"]:
+            await run_blocking(fan_out, db, client_socket, command)
+        elif command.lower() == "stats":
+            await client_socket.send(metrics.render_text().encode('utf-8'))
+        elif command.lower() == "exit":
+            await client_socket.send(b"Exiting...\n")
+            break
+        else:
+            names = ', '.join(f"'{name}'" for name in backends.names())
+            await client_socket.send(f"Invalid command. Please enter {names}, or 'exit'.\n".encode('utf-8'))
+
+
+async def process_vcs_commands(client_socket, facade, vcs_type, repo_path, db):
+    await client_socket.send(f"[{vcs_type} [{repo_path}]]".encode('utf-8'))
+    command_iterator = CommandIterator(client_socket)
+    profiler = SessionProfiler(vcs_type, repo_path)
+    visit = profiler.dispatch(command_executor.visit)
+
+    def execute(sock, command):
+        if command.lower().split()[:1] == ["profile"]:
+            profiler.control(sock, command)
+        else:
+            visit(sock, vcs_type, command, facade.with_socket(sock), repo_path)
+
+    try:
+        while True:
+            command = (await client_socket.recv(1024)).decode('utf-8').strip()
+            if command.lower() == "back":
+                return
+            try:
+                command_iterator.add_batch(command)
+            except (OverflowError, ValueError) as e:
+                await client_socket.send(f"Error: {e}\n".encode('utf-8'))
+                continue
+            await run_batch_async(client_socket, list(command_iterator),
+                                  lambda sock, cmd: run_blocking(execute, sock, cmd))
+    finally:
+        await run_blocking(profiler.close)
+
+
+async def handle_client_peer_wrapper(reader, writer, registry=None):
+    logging.info(f"Accepted connection from {writer.get_extra_info('peername')}")
+    client_socket = AsyncClientSocket(reader, writer, asyncio.get_running_loop())
+    try:
+        await client_socket.negotiate()
+        if registry is not None and client_socket.redirects:
+            target = await run_blocking(registry.redirect_target)
+            if target is not None:
+                await client_socket.redirect(*target)
+                return
+        db = DataBase(db_name)
+        await run_blocking(peer_load.session_started)
+        try:
+            await handle_peer(client_socket, db, registry)
+        finally:
+            await run_blocking(peer_load.session_finished)
+    except (ConnectionAbortedError, ConnectionResetError, BrokenPipeError) as exp:
+        logging.error(f"Connection reset: {exp}")
+    except ProtocolError as exp:
+        logging.error(f"Protocol error: {exp}")
+    finally:
+        try:
+            await client_socket.close()
+        except (ConnectionError, OSError):
+            pass
+
+
+async def start_async_server_peer(server_socket, registry=None):
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=async_workers)
+    loop.set_default_executor(executor)
+    peer_load.executor = executor
+    server = await asyncio.start_server(partial(handle_client_peer_wrapper, registry=registry), sock=server_socket)
+    logging.info(f"Async server started on port {server_socket.getsockname()[1]}. Waiting for connections...")
+    async with server:
+        await server.serve_forever()
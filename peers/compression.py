@@ -0,0 +1,59 @@
+import lzma
+import time
+import zlib
+from config.config import compression, compression_levels
+from modules.metrics import metrics
+
+CAPABILITY_COMPRESS = b'compress='
+ALGORITHMS = ('zlib', 'lzma')
+
+
+def offer(algorithms=compression):
+    supported = [algorithm for algorithm in algorithms if algorithm in ALGORITHMS]
+    return [CAPABILITY_COMPRESS + ','.join(supported).encode('ascii')] if supported else []
+
+
+def offered(capabilities):
+    for capability in capabilities:
+        if capability.startswith(CAPABILITY_COMPRESS):
+            return capability[len(CAPABILITY_COMPRESS):].decode('ascii', errors='replace').split(',')
+    return []
+
+
+def choose(capabilities, algorithms=compression):
+    client_algorithms = offered(capabilities)
+    for algorithm in algorithms:
+        if algorithm in ALGORITHMS and algorithm in client_algorithms:
+            return algorithm
+    return None
+
+
+class StreamCompressor:
+    def __init__(self, algorithm):
+        self.algorithm = algorithm
+        level = compression_levels.get(algorithm)
+        if algorithm == 'zlib':
+            self.compressor = zlib.compressobj(level if level is not None else zlib.Z_DEFAULT_COMPRESSION)
+        else:
+            self.compressor = lzma.LZMACompressor(preset=level)
+
+    def compress(self, data):
+        started = time.thread_time()
+        if self.algorithm == 'zlib':
+            output = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        else:
+            output = self.compressor.compress(data)
+        metrics.compressed(self.algorithm, len(data), len(output), time.thread_time() - started)
+        return output
+
+    def flush(self):
+        started = time.thread_time()
+        output = self.compressor.flush()
+        metrics.compressed(self.algorithm, 0, len(output), time.thread_time() - started)
+        return output
+
+
+def decompressor(algorithm):
+    if algorithm == 'zlib':
+        return zlib.decompressobj()
+    return lzma.LZMADecompressor()
@@ -0,0 +1,37 @@
+import threading
+from modules import process
+
+
+class PeerLoad:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = 0
+        self.executor = None
+        self.listeners = []
+
+    def session_started(self):
+        with self.lock:
+            self.sessions += 1
+        self.changed()
+
+    def session_finished(self):
+        with self.lock:
+            self.sessions -= 1
+        self.changed()
+
+    def changed(self):
+        for listener in list(self.listeners):
+            listener()
+
+    def queue_depth(self):
+        work_queue = getattr(self.executor, '_work_queue', None)
+        return work_queue.qsize() if work_queue is not None else 0
+
+    def snapshot(self):
+        return self.sessions, process.running(), self.queue_depth()
+
+    def score(self):
+        return sum(self.snapshot())
+
+
+peer_load = PeerLoad()
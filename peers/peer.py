@@ -1,58 +1,109 @@
+import asyncio
 import logging
 import socket
 import threading
-from config.config import db_name, SI, file_log
+from config.config import db_name, file_log, server_mode, client_protocol, prefetch_enabled
 from db.database import DataBase
+from modules import backends
 from modules.facade import VCSF
+from modules.fanout import fan_out
 from modules.factories import VCSFA
+from modules.batch import run_batch
 from modules.itarator import CommandIterator
-from modules.visitor import Executor
-from utils.utils import show_active_repositories, find_free_port
+from modules.metrics import metrics
+from modules.prefetch import PrefetchScheduler
+from modules.profiling import SessionProfiler
+from modules.visitor import command_executor
+from peers.async_peer import start_async_server_peer
+from peers.load import peer_load
+from peers.protocol import PeerConnection, PeerRedirect, ProtocolError, connect_framed, set_nodelay
+from peers.registry import PeerRegistry, lookup_peer
+from utils.utils import show_active_repositories, show_menu
 
 
-def handle_peer(client_socket, db):
-    client_socket.sendall(b"Choose a VCS type (git, mercurial, svn), write 'sar' to show active repositories, or 'exit' to quit.")
+def handle_peer(client_socket, db, registry=None):
+    show_menu(client_socket)
     while True:
         command = client_socket.recv(1024).decode('utf-8').strip()
-        if command.lower() in ["git", "svn", "mercurial"]:
-            vcs_type = command.lower()
+        vcs_type = backends.resolve(command)
+        if vcs_type is not None:
             client_socket.sendall(b"Enter path to " + vcs_type.encode('utf-8') + b" repository: ")
             repo_path = client_socket.recv(1024).decode('utf-8').strip()
+            target = registry.redirect_target(repo_path) if registry is not None and client_socket.redirects else None
+            if target is not None:
+                client_socket.redirect(*target, replay=[vcs_type, repo_path])
+                break
             adapter = VCSFA().create_vcs(client_socket, vcs_type, db)
             facade = VCSF(adapter)
             process_vcs_commands(client_socket, facade, vcs_type, repo_path, db)
-        elif command.lower() == "sar":
-            show_active_repositories(db, client_socket)
+            show_menu(client_socket)
+        elif command.lower().split()[:1] == ["sar"]:
+            show_active_repositories(db, client_socket, command)
+        elif command.lower().split()[:1] == ["all"]:
+            fan_out(db, client_socket, command)
+        elif command.lower() == "stats":
+            client_socket.sendall(metrics.render_text().encode('utf-8'))
         elif command.lower() == "exit":
             client_socket.sendall(b"Exiting...\n")
             break
         else:
-            client_socket.sendall(b"Invalid command. Please enter 'git', 'svn', 'mercurial', or 'exit'.\n")
+            names = ', '.join(f"'{name}'" for name in backends.names())
+            client_socket.sendall(f"Invalid command. Please enter {names}, or 'exit'.\n".encode('utf-8'))
 
 
 
 def process_vcs_commands(client_socket, facade, vcs_type, repo_path, db):
     client_socket.sendall(f"[{vcs_type} [{repo_path}]]".encode('utf-8'))
     command_iterator = CommandIterator(client_socket)
-    command_executor = Executor()
+    profiler = SessionProfiler(vcs_type, repo_path)
+    visit = profiler.dispatch(command_executor.visit)
 
-    while True:
-        command = client_socket.recv(1024).decode('utf-8').strip()
-        if command.lower() == "back":
-            handle_peer(client_socket, db)
+    def execute(sock, command):
+        if command.lower().split()[:1] == ["profile"]:
+            profiler.control(sock, command)
         else:
-            command_iterator.add_command(command)
-            for cmd in command_iterator:
-                command_executor.visit(client_socket, vcs_type, cmd, facade, repo_path)
+            visit(sock, vcs_type, command, facade.with_socket(sock), repo_path)
 
+    try:
+        while True:
+            command = client_socket.recv(1024).decode('utf-8').strip()
+            if command.lower() == "back":
+                return
+            try:
+                command_iterator.add_batch(command)
+            except (OverflowError, ValueError) as e:
+                client_socket.sendall(f"Error: {e}\n".encode('utf-8'))
+                continue
+            run_batch(client_socket, list(command_iterator), execute)
+    finally:
+        profiler.close()
+
+
+def connect_to_peer(db):
+    while True:
+        peer = lookup_peer(db)
+        if peer is None:
+            return None
+        port, pid, host = peer
+        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            client_socket.connect((host, port))
+            set_nodelay(client_socket)
+            return client_socket
+        except ConnectionRefusedError:
+            client_socket.close()
+            db.unregister_peer(port, pid)
 
 def start_client_peer():
-    port = find_free_port()
-    if port is None: return
+    db = DataBase(db_name)
+    db.create_tables()
+    client_socket = connect_to_peer(db)
+    if client_socket is None: return
 
-    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    client_socket.connect((SI, port))
     try:
+        if client_protocol == 'framed':
+            run_framed_client(client_socket)
+            return
         data = client_socket.recv(4096).decode('utf-8')
         print(data)
         while True:
@@ -65,30 +116,71 @@ def start_client_peer():
     finally:
         client_socket.close()
 
-def handle_client_peer_wrapper(client_socket):
+def run_framed_client(client_socket):
+    client, greeting = connect_framed(client_socket)
+    print(greeting)
     try:
+        while True:
+            command = input('[-]')
+            request_id = client.send_command(command)
+            try:
+                for chunk in client.iter_response(request_id):
+                    print(chunk, end='', flush=True)
+            except PeerRedirect as redirect:
+                client.sock.close()
+                client, response = connect_framed(socket.create_connection((redirect.host, redirect.port)),
+                                                  redirect.replay)
+                print(response, end='')
+            print()
+            if command.lower() == "exit":
+                break
+    finally:
+        client.sock.close()
+
+def handle_client_peer_wrapper(client_socket, registry=None):
+    client_socket = PeerConnection(client_socket)
+    try:
+        client_socket.negotiate()
+        target = registry.redirect_target() if registry is not None and client_socket.redirects else None
+        if target is not None:
+            client_socket.redirect(*target)
+            return
         db = DataBase(db_name)
-        db.create_tables()
-        handle_peer(client_socket, db)
+        peer_load.session_started()
+        try:
+            handle_peer(client_socket, db, registry)
+        finally:
+            peer_load.session_finished()
     except (ConnectionAbortedError, ConnectionResetError) as exp:
         logging.error(f"Connection reset: {exp}")
+    except ProtocolError as exp:
+        logging.error(f"Protocol error: {exp}")
     finally:
         client_socket.close()
 
-def start_server_peer():
+def start_server_peer(mode=server_mode):
     logging.basicConfig(filename= file_log, level=logging.INFO)
-    free_port = find_free_port()
+    if mode not in ('async', 'threaded'):
+        raise ValueError(f"Unsupported server mode: {mode}")
+    db = DataBase(db_name)
+    db.create_tables()
+    registry = PeerRegistry(db)
+    server_socket = registry.bind()
+
+    if server_socket is None: return
+    metrics.start_reporter()
+    if prefetch_enabled:
+        PrefetchScheduler(db).start()
+    if mode == 'async':
+        asyncio.run(start_async_server_peer(server_socket, registry))
+        return
 
-    if free_port is None: return
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_socket.bind((SI, free_port))
-    server_socket.listen(1)
-    logging.info(f"Server started on port {free_port}. Waiting for connections...")
+    logging.info(f"Server started on port {registry.port}. Waiting for connections...")
 
     while True:
         client_socket, client_address = server_socket.accept()
         logging.info(f"Accepted connection from {client_address}")
-        client_thread = threading.Thread(target=handle_client_peer_wrapper, args=(client_socket,))
+        client_thread = threading.Thread(target=handle_client_peer_wrapper, args=(client_socket, registry))
         client_thread.start()
 
 if __name__ == "__main__":
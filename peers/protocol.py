@@ -0,0 +1,275 @@
+import codecs
+import socket
+import struct
+import time
+from collections import namedtuple
+from config.config import handshake_timeout, frame_size, max_frame_size, peer_redirect_hops, compression_threshold
+from peers import compression
+
+MAGIC = b'VCSF'
+PROTOCOL_VERSION = b'1'
+HEADER = struct.Struct('!IBIB')
+
+MSG_HELLO = 1
+MSG_COMMAND = 2
+MSG_DATA = 3
+MSG_REDIRECT = 4
+
+CAPABILITY_REDIRECT = b'redirect'
+
+FLAG_END = 0x01
+FLAG_COMPRESSED = 0x02
+
+Frame = namedtuple('Frame', ['msg_type', 'request_id', 'flags', 'payload'])
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class PeerRedirect(Exception):
+    def __init__(self, host, port, replay):
+        super().__init__(f"Redirected to {host}:{port}")
+        self.host = host
+        self.port = port
+        self.replay = replay
+
+    def encode(self):
+        return '\n'.join([self.host, str(self.port)] + self.replay).encode('utf-8')
+
+    @classmethod
+    def decode(cls, payload):
+        host, port, *replay = payload.decode('utf-8').split('\n')
+        return cls(host, int(port), replay)
+
+
+def set_nodelay(sock):
+    if sock is None:
+        return
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError:
+        pass
+
+
+def encode_frame(msg_type, request_id, payload=b'', flags=0):
+    return HEADER.pack(len(payload), msg_type, request_id, flags) + payload
+
+
+class FrameDecoder:
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer.extend(data)
+
+    def next_frame(self):
+        if len(self.buffer) < HEADER.size:
+            return None
+        length, msg_type, request_id, flags = HEADER.unpack_from(self.buffer)
+        if length > max_frame_size:
+            raise ProtocolError(f"Frame of {length} bytes exceeds the {max_frame_size} byte limit")
+        end = HEADER.size + length
+        if len(self.buffer) < end:
+            return None
+        payload = bytes(self.buffer[HEADER.size:end])
+        del self.buffer[:end]
+        return Frame(msg_type, request_id, flags, payload)
+
+
+def accept_hello(payload):
+    capabilities = payload.split()[1:]
+    algorithm = compression.choose(capabilities)
+    reply = PROTOCOL_VERSION + (b' ' + compression.CAPABILITY_COMPRESS + algorithm.encode('ascii') if algorithm else b'')
+    return reply, CAPABILITY_REDIRECT in capabilities, algorithm
+
+
+class ResponseFramer:
+    def __init__(self, algorithm=None):
+        self.request_id = 0
+        self.open = True
+        self.algorithm = algorithm
+        self.compressor = None
+        self.sent = 0
+
+    def begin(self, request_id):
+        self.request_id = request_id
+        self.open = True
+        self.compressor = None
+        self.sent = 0
+
+    def data(self, payload):
+        if self.algorithm is not None:
+            self.sent += len(payload)
+            if self.compressor is None and self.sent >= compression_threshold:
+                self.compressor = compression.StreamCompressor(self.algorithm)
+            if self.compressor is not None:
+                return self.frames(self.compressor.compress(payload), FLAG_COMPRESSED)
+        return self.frames(payload)
+
+    def frames(self, payload, flags=0):
+        view = memoryview(payload)
+        return b''.join(encode_frame(MSG_DATA, self.request_id, bytes(view[i:i + frame_size]), flags)
+                        for i in range(0, len(view), frame_size))
+
+    def end(self):
+        if not self.open:
+            return b''
+        self.open = False
+        tail = self.frames(self.compressor.flush(), FLAG_COMPRESSED) if self.compressor is not None else b''
+        return tail + encode_frame(MSG_DATA, self.request_id, flags=FLAG_END)
+
+
+def sniff_magic(sock):
+    sock.settimeout(handshake_timeout)
+    try:
+        while True:
+            head = sock.recv(len(MAGIC), socket.MSG_PEEK)
+            if not head or not MAGIC.startswith(head):
+                return False
+            if len(head) == len(MAGIC):
+                sock.recv(len(MAGIC))
+                return True
+            time.sleep(0.01)
+    except socket.timeout:
+        return False
+    finally:
+        sock.settimeout(None)
+
+
+class PeerConnection:
+    def __init__(self, sock):
+        self.sock = sock
+        set_nodelay(sock)
+        self.framed = False
+        self.redirects = False
+        self.decoder = FrameDecoder()
+        self.framer = ResponseFramer()
+
+    def negotiate(self):
+        if not sniff_magic(self.sock):
+            return
+        hello = self.read_frame()
+        if hello.msg_type != MSG_HELLO:
+            raise ProtocolError("Expected a hello frame after the protocol magic")
+        reply, self.redirects, self.framer.algorithm = accept_hello(hello.payload)
+        self.sock.sendall(encode_frame(MSG_HELLO, 0, reply))
+        self.framed = True
+
+    def read_frame(self):
+        while True:
+            frame = self.decoder.next_frame()
+            if frame is not None:
+                return frame
+            data = self.sock.recv(frame_size)
+            if not data:
+                raise ConnectionResetError("Peer closed the connection")
+            self.decoder.feed(data)
+
+    def recv(self, bufsize):
+        if not self.framed:
+            return self.sock.recv(bufsize)
+        self.sock.sendall(self.framer.end())
+        while True:
+            frame = self.read_frame()
+            if frame.msg_type == MSG_COMMAND:
+                self.framer.begin(frame.request_id)
+                return frame.payload
+
+    def sendall(self, data):
+        if self.framed:
+            data = self.framer.data(data)
+        self.sock.sendall(data)
+
+    def redirect(self, host, port, replay=()):
+        self.framer.open = False
+        self.sock.sendall(encode_frame(MSG_REDIRECT, self.framer.request_id,
+                                       PeerRedirect(host, port, list(replay)).encode(), FLAG_END))
+
+    def close(self):
+        try:
+            if self.framed:
+                self.sock.sendall(self.framer.end())
+        except OSError:
+            pass
+        finally:
+            self.sock.close()
+
+
+class FramedClient:
+    def __init__(self, sock):
+        self.sock = sock
+        set_nodelay(sock)
+        self.decoder = FrameDecoder()
+        self.next_request_id = 1
+        self.compression = None
+
+    def hello(self):
+        capabilities = [PROTOCOL_VERSION, CAPABILITY_REDIRECT] + compression.offer()
+        self.sock.sendall(MAGIC + encode_frame(MSG_HELLO, 0, b' '.join(capabilities)))
+        frame = self.read_frame()
+        if frame.msg_type != MSG_HELLO:
+            raise ProtocolError("Server did not answer the protocol hello")
+        algorithms = compression.offered(frame.payload.split()[1:])
+        self.compression = algorithms[0] if algorithms else None
+
+    def read_frame(self):
+        while True:
+            frame = self.decoder.next_frame()
+            if frame is not None:
+                return frame
+            data = self.sock.recv(frame_size)
+            if not data:
+                raise ConnectionResetError("Server closed the connection")
+            self.decoder.feed(data)
+
+    def send_command(self, command):
+        request_id = self.next_request_id
+        self.next_request_id += 1
+        self.sock.sendall(encode_frame(MSG_COMMAND, request_id, command.encode('utf-8')))
+        return request_id
+
+    def iter_response(self, request_id=0):
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        decompressor = None
+        while True:
+            frame = self.read_frame()
+            if frame.msg_type == MSG_REDIRECT and frame.request_id == request_id:
+                raise PeerRedirect.decode(frame.payload)
+            if frame.msg_type != MSG_DATA or frame.request_id != request_id:
+                continue
+            payload = frame.payload
+            if frame.flags & FLAG_COMPRESSED:
+                if self.compression is None:
+                    raise ProtocolError("Received a compressed frame without negotiating compression")
+                if decompressor is None:
+                    decompressor = compression.decompressor(self.compression)
+                payload = decompressor.decompress(payload)
+            text = decoder.decode(payload, final=bool(frame.flags & FLAG_END))
+            if text:
+                yield text
+            if frame.flags & FLAG_END:
+                return
+
+    def read_response(self, request_id=0):
+        return ''.join(self.iter_response(request_id))
+
+    def open_session(self, replay=()):
+        self.hello()
+        response = self.read_response()
+        for command in replay:
+            response = self.read_response(self.send_command(command))
+        return response
+
+
+def connect_framed(sock, replay=(), hops=peer_redirect_hops):
+    for _ in range(hops + 1):
+        client = FramedClient(sock)
+        try:
+            return client, client.open_session(replay)
+        except PeerRedirect as redirect:
+            sock.close()
+            replay = redirect.replay or replay
+            sock = socket.create_connection((redirect.host, redirect.port))
+    sock.close()
+    raise ProtocolError(f"Gave up after {hops} redirects")
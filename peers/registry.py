@@ -0,0 +1,145 @@
+import atexit
+import hashlib
+import logging
+import os
+import socket
+import threading
+import time
+from config.config import (SI, server_ports, peer_heartbeat_interval, peer_stale_after, peer_lookup_timeout,
+                           peer_routing, peer_affinity, peer_redirect_threshold)
+from peers.load import peer_load
+
+
+def process_alive(pid):
+    if os.name != 'posix':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def bind_socket(port):
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if hasattr(socket, 'SO_EXCLUSIVEADDRUSE'):
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+    else:
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        server_socket.bind((SI, port))
+        server_socket.listen()
+    except OSError:
+        server_socket.close()
+        return None
+    return server_socket
+
+
+def rendezvous_owner(peers, key):
+    return max(peers, key=lambda peer: hashlib.blake2b(f"{peer[2]}:{peer[0]}|{key}".encode('utf-8')).digest())
+
+
+class PeerRegistry:
+    def __init__(self, database, load=peer_load):
+        self.database = database
+        self.load = load
+        self.pid = os.getpid()
+        self.port = None
+        self.stopped = threading.Event()
+
+    def bind(self):
+        self.database.reap_peers(time.time() - peer_stale_after)
+        taken = set()
+        for port, pid, host in self.database.fetch_live_peers(time.time() - peer_stale_after):
+            if host == SI and not process_alive(pid):
+                self.database.unregister_peer(port, pid)
+            else:
+                taken.add(port)
+        for port in server_ports:
+            if port in taken:
+                continue
+            server_socket = bind_socket(port)
+            if server_socket is not None:
+                self.register(port)
+                return server_socket
+        return None
+
+    def register(self, port):
+        self.port = port
+        self.database.register_peer(port, self.pid, SI, time.time())
+        self.load.listeners.append(self.publish)
+        threading.Thread(target=self.run_heartbeat, name='peer-heartbeat', daemon=True).start()
+        atexit.register(self.unregister)
+
+    def publish(self):
+        if self.port is None:
+            return
+        try:
+            if not self.database.heartbeat_peer(self.port, self.pid, time.time(), self.load.snapshot()):
+                self.database.register_peer(self.port, self.pid, SI, time.time())
+        except Exception as e:
+            logging.warning(f"Cannot publish load for peer on port {self.port}: {e}")
+
+    def run_heartbeat(self):
+        while not self.stopped.wait(peer_heartbeat_interval):
+            self.publish()
+            try:
+                reaped = self.database.reap_peers(time.time() - peer_stale_after)
+                if reaped:
+                    logging.info(f"Reaped {reaped} stale peer registrations")
+            except Exception as e:
+                logging.warning(f"Peer heartbeat failed: {e}")
+
+    def redirect_target(self, repo_path=None):
+        if self.port is None:
+            return None
+        cutoff = time.time() - peer_stale_after
+        if repo_path is not None:
+            if not peer_affinity:
+                return None
+            peers = self.database.fetch_live_peers(cutoff)
+            if not peers:
+                return None
+            port, pid, host = rendezvous_owner(peers, os.path.abspath(repo_path))
+        else:
+            if peer_routing != 'least_loaded':
+                return None
+            peer = self.database.find_least_loaded_peer(cutoff)
+            if peer is None or self.load.score() - peer[3] < peer_redirect_threshold:
+                return None
+            port, pid, host = peer[:3]
+        if port == self.port or (host == SI and not process_alive(pid)):
+            return None
+        return host, port
+
+    def unregister(self):
+        self.stopped.set()
+        if self.publish in self.load.listeners:
+            self.load.listeners.remove(self.publish)
+        if self.port is not None:
+            try:
+                self.database.unregister_peer(self.port, self.pid)
+            except Exception as e:
+                logging.warning(f"Cannot unregister peer on port {self.port}: {e}")
+            self.port = None
+
+
+def lookup_peer(database, timeout=peer_lookup_timeout, routing=peer_routing):
+    deadline = time.monotonic() + timeout
+    while True:
+        cutoff = time.time() - peer_stale_after
+        if routing == 'least_loaded':
+            peer = database.find_least_loaded_peer(cutoff)
+        else:
+            peer = database.find_peer(os.getpid(), cutoff)
+        if peer is not None:
+            port, pid, host = peer[:3]
+            if host != SI or process_alive(pid):
+                return port, pid, host
+            database.unregister_peer(port, pid)
+            continue
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(0.1)
@@ -1,9 +1,12 @@
+import sys
 import threading
+from config.config import server_mode
 from peers.peer import start_server_peer, start_client_peer
 
 
 def main():
-    server_thread = threading.Thread(target=start_server_peer)
+    mode = sys.argv[1] if len(sys.argv) > 1 else server_mode
+    server_thread = threading.Thread(target=start_server_peer, args=(mode,))
     server_thread.start()
     client_thread = threading.Thread(target=start_client_peer)
     client_thread.start()
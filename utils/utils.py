@@ -1,18 +1,19 @@
 import os
-import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from colorama import Fore, Style
-from config.config import SI, server_ports
+from config.config import sar_workers, sar_cache_ttl, sar_page_size
+from modules import backends
+from modules.observer import RepositoryObserver, repository_events
 
 
-def is_port_free(port):
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        return s.connect_ex((SI, port)) != 0
+def show_menu(client_socket):
+    client_socket.sendall(f"Choose a VCS type ({', '.join(backends.names())}), write 'sar' to show active repositories, "
+                          .encode('utf-8') +
+                          b"'all <command> [--vcs type]' to run a command in every repository, 'stats' to show server metrics, "
+                          b"or 'exit' to quit.")
 
-def find_free_port():
-    for port in server_ports:
-        if is_port_free(port):
-            return port
-    return None
 def help(client_socket):
     help_message = (
         "Available commands:\n"
@@ -21,39 +22,102 @@ def help(client_socket):
         "  - push: Push changes to the remote repository.\n"
         "  - help: Display this help message.\n"
         "  - init [repository_name]: Initialize a new repository.\n"
-        "  - log: View commit history.\n"
+        "  - log [--limit N] [--offset N] [--since DATE] [--until DATE] [--path PATH]: View commit history.\n"
+        "  - log [--author NAME] [--since DATE] [--until DATE]: Query the indexed commit history.\n"
+        "  - search [text]: Full-text search over indexed commit messages.\n"
         "  - status: View repository status.\n"
         "  - add [file1, file2, ...]: Add specific files to the staging area.\n"
         "  - add_all: Add all changes to the staging area.\n"
+        "  - backup [--history]: Store an incremental, deduplicated snapshot of the repository, or with --history an incremental bundle/dump of the new history.\n"
+        "  - backups: List stored snapshots.\n"
+        "  - backup_load [name[@snapshot]] [local_path] [path ...]: Restore a snapshot (latest by default), optionally only the given paths.\n"
+        "  - backup_load --history [name[@sequence]] [local_path]: Rebuild a repository from its history backup chain.\n"
+        "  - stats: Show per-command latency, subprocess time and traffic recorded by this server.\n"
+        "  - cache clear: Drop the cached log and branch list output of this repository.\n"
+        "  - profile on|off: Profile the commands of this session and write the report to the profile directory.\n"
         "  - back: Return to the main menu.\n"
+        "Several commands can be sent at once separated by ';' (e.g. add a, b; commit msg; push). They run in order\n"
+        "and the batch stops at the first failing command; quote arguments that contain ';'.\n"
     )
     client_socket.sendall(help_message.encode('utf-8'))
 
 
-def show_active_repositories(database, client_socket):
+SAR_CHUNK_LINES = 50
+
+
+class ActiveRepositoriesCache(RepositoryObserver):
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.lines = None
+        self.expires_at = 0
+        self.lock = threading.Lock()
+
+    def get(self, database):
+        with self.lock:
+            if self.lines is None or time.monotonic() >= self.expires_at:
+                self.lines = check_repositories(database)
+                self.expires_at = time.monotonic() + self.ttl
+            return self.lines
+
+    def repository_changed(self, repo_path):
+        with self.lock:
+            self.lines = None
+
+
+def check_repository(repository):
+    name, vcs_type, repo_path = repository
+    backend = backends.by_db_name(vcs_type)
+    if backend is None:
+        return None
+    return os.path.exists(os.path.join(repo_path, backend.marker))
+
+
+def check_repositories(database):
     repositories = database.fetch_active_repositories()
+    with ThreadPoolExecutor(max_workers=sar_workers) as executor:
+        results = list(executor.map(check_repository, repositories))
+
+    lines = []
+    stale = []
+    for (name, vcs_type, repo_path), exists in zip(repositories, results):
+        line = f"Name: {name}, VCS Type: {vcs_type}, Path: {repo_path}\n"
+        if exists is None:
+            line += Fore.RED + f"Unsupported VCS Type: {vcs_type}" + Style.RESET_ALL + "\n"
+        elif not exists:
+            line += Fore.RED + f"Repository at {repo_path} does not exist. Removing from the database." + Style.RESET_ALL + "\n"
+            stale.append(name)
+        lines.append(line)
+    if stale:
+        database.remove_repositories(stale)
+    return lines
+
+
+def parse_page(command):
+    args = command.split()[1:]
+    page = int(args[0]) if args else 1
+    page_size = int(args[1]) if len(args) > 1 else sar_page_size
+    if page < 1 or page_size < 1:
+        raise ValueError("Page and page size must be positive")
+    return page, page_size
 
-    if repositories:
-        response = Fore.RED + "Active Repositories:" + Style.RESET_ALL + "\n"
-        for name, vcs_type, repo_path in repositories:
-            response += f"Name: {name}, VCS Type: {vcs_type}, Path: {repo_path}\n"
-
-            if vcs_type == "Git":
-                if not os.path.exists(os.path.join(repo_path, '.git')):
-                    response += Fore.RED + f"Repository at {repo_path} does not exist. Removing from the database." + Style.RESET_ALL + "\n"
-                    database.remove_repository(name)
-            elif vcs_type == "Mercurial":
-                if not os.path.exists(os.path.join(repo_path, '.hg')):
-                    response += Fore.RED + f"Repository at {repo_path} does not exist. Removing from the database." + Style.RESET_ALL + "\n"
-                    database.remove_repository(name)
-            elif vcs_type == "SVN":
-                if not os.path.exists(os.path.join(repo_path, '.svn')):
-                    response += Fore.RED + f"Repository at {repo_path} does not exist. Removing from the database." + Style.RESET_ALL + "\n"
-                    database.remove_repository(name)
-            else:
-                response += Fore.RED + f"Unsupported VCS Type: {vcs_type}" + Style.RESET_ALL + "\n"
-
-        client_socket.sendall(response.encode('utf-8'))
+
+def show_active_repositories(database, client_socket, command="sar"):
+    try:
+        page, page_size = parse_page(command)
+    except ValueError as e:
+        client_socket.sendall(f"Error executing 'sar' command: {str(e)}\n".encode('utf-8'))
+        return
+    lines = active_repositories.get(database)
+
+    if lines:
+        pages = (len(lines) + page_size - 1) // page_size
+        selected = lines[(page - 1) * page_size:page * page_size]
+        client_socket.sendall((Fore.RED + f"Active Repositories (page {page} of {pages}):" + Style.RESET_ALL + "\n").encode('utf-8'))
+        for start in range(0, len(selected), SAR_CHUNK_LINES):
+            client_socket.sendall(''.join(selected[start:start + SAR_CHUNK_LINES]).encode('utf-8'))
     else:
         client_socket.sendall((Fore.RED + "No active repositories found." + Style.RESET_ALL + "\n").encode('utf-8'))
 
+
+active_repositories = ActiveRepositoriesCache(sar_cache_ttl)
+repository_events.attach(active_repositories)